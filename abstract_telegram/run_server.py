@@ -1,15 +1,22 @@
+import argparse
+import asyncio
 import json
 import logging
 import logging.config
+import multiprocessing
 import os
 import signal
-import socket
+import struct
 from typing import Any
 
 dict_config = {
     'version': 1,
     'formatters': {
-        'simple': {'format': '%(asctime)s [%(levelname)s]: %(message)s'},
+        'simple': {
+            'format': (
+                '%(asctime)s [%(levelname)s] %(processName)s: %(message)s'
+            ),
+        },
     },
     'handlers': {
         'console': {
@@ -19,7 +26,7 @@ dict_config = {
     },
     'loggers': {
         'telegram': {
-            'level': 'DEBUG',
+            'level': os.environ.get('ABSTRACT_TELEGRAM_LOG_LEVEL', 'DEBUG'),
             'handlers': ['console'],
         },
     },
@@ -30,45 +37,183 @@ logger = logging.getLogger('telegram')
 
 HOST = os.environ.get('ABSTRACT_TELEGRAM_HOST', '127.0.0.1')
 PORT = int(os.environ.get('ABSTRACT_TELEGRAM_PORT', '65432'))
+BACKLOG = int(os.environ.get('ABSTRACT_TELEGRAM_BACKLOG', '4096'))
+MAX_FRAME_SIZE = int(
+    os.environ.get('ABSTRACT_TELEGRAM_MAX_FRAME_SIZE', '1048576'),
+)
+# Every frame is a JSON document prefixed by its length as 4-byte unsigned
+# big-endian integer. Document is either a single message or an array of
+# messages, the response mirrors its shape.
+FRAME_HEADER = struct.Struct('!I')
+WORKERS = int(os.environ.get('ABSTRACT_TELEGRAM_WORKERS', '1'))
+
+
+class Counters:
+
+    def __init__(self) -> None:
+        self.messages = 0
+        self.bytes = 0
+
+
+# Counters of the current process, workers report them at shutdown
+counters = Counters()
 
 
 class GracefulKiller:
     kill_now = False
 
-    def __init__(self) -> None:
-        signal.signal(signal.SIGINT, self.exit_gracefully)
-        signal.signal(signal.SIGTERM, self.exit_gracefully)
+    def __init__(self, loop: asyncio.AbstractEventLoop) -> None:
+        self.stopped = asyncio.Event()
+        loop.add_signal_handler(signal.SIGINT, self.exit_gracefully)
+        loop.add_signal_handler(signal.SIGTERM, self.exit_gracefully)
 
     def exit_gracefully(self, *args: Any) -> None:
         logger.info('Graceful stopping...')
         self.kill_now = True
-        server.close()
+        self.stopped.set()
 
 
-if __name__ == '__main__':
-    killer = GracefulKiller()
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server:
-        logger.info('Abstract telegram server start for listening')
-        server.bind((HOST, PORT))
-        while not killer.kill_now:
-            server.listen()
+def encode_frame(payload: Any) -> bytes:
+    body = json.dumps(payload).encode('utf8')
+    return FRAME_HEADER.pack(len(body)) + body
+
+
+def handle_message(message: Any) -> dict:
+    if not isinstance(message, dict):
+        logger.warning(f'Got malformed message: {message}')
+        return {'id': None, 'status': 'rejected'}
+    response = {'id': message.get('id'), 'status': 'accepted'}
+    try:
+        telegram = message['telegram']
+        text = message['message']
+    except KeyError:
+        logger.warning(f'Got malformed message: {message}')
+        response['status'] = 'rejected'
+    else:
+        logger.debug(f'Got message, addressed to {telegram}: {text}')
+        counters.messages += 1
+    return response
+
+
+def handle_frame(payload: Any) -> Any:
+    if isinstance(payload, list):
+        return [handle_message(message) for message in payload]
+    return handle_message(payload)
+
+
+async def handle_connection(
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+) -> None:
+    addr = writer.get_extra_info('peername')
+    logger.info(f'Accepted connection from {addr}')
+    try:
+        while True:
+            header = await reader.readexactly(FRAME_HEADER.size)
+            (size,) = FRAME_HEADER.unpack(header)
+            if size > MAX_FRAME_SIZE:
+                logger.warning(f'Frame of {size} bytes from {addr} is too big')
+                break
+            data = await reader.readexactly(size)
+            counters.bytes += FRAME_HEADER.size + size
             try:
-                conn, addr = server.accept()
-            except OSError:
-                pass
-            else:
-                with conn:
-                    logger.info(f'Received message from {addr}')
-                    while True:
-                        data = conn.recv(1024)
-                        if not data:
-                            break
-                        decoded_data = json.loads(data.decode('utf8'))
-                        telegram = decoded_data['telegram']
-                        message = decoded_data['message']
-                        logger.info(
-                            f'Got message, addressed to {telegram}: {message}',
-                        )
-                        conn.sendall(
-                            json.dumps({'status': 'accepted'}).encode('utf8'),
-                        )
+                payload = json.loads(data)
+            except ValueError:
+                logger.warning(f'Frame from {addr} is not valid JSON')
+                break
+            writer.write(encode_frame(handle_frame(payload)))
+            await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+    logger.info(f'Closed connection from {addr}')
+
+
+async def serve(reuse_port: bool = False) -> None:
+    killer = GracefulKiller(asyncio.get_running_loop())
+    server = await asyncio.start_server(
+        handle_connection,
+        HOST,
+        PORT,
+        backlog=BACKLOG,
+        reuse_port=reuse_port,
+    )
+    logger.info('Abstract telegram server start for listening')
+    async with server:
+        await killer.stopped.wait()
+
+
+def install_uvloop() -> None:
+    try:
+        import uvloop
+    except ImportError:
+        logger.info('uvloop is not installed, using default event loop')
+    else:
+        uvloop.install()
+
+
+def log_counters(messages: int, bytes_count: int, scope: str) -> None:
+    logger.info(f'{scope} accepted {messages} messages, {bytes_count} bytes')
+
+
+def run_worker(results: multiprocessing.Queue) -> None:
+    install_uvloop()
+    asyncio.run(serve(reuse_port=True))
+    log_counters(counters.messages, counters.bytes, 'Worker')
+    results.put((counters.messages, counters.bytes))
+
+
+def run_workers(workers: int) -> None:
+    # Workers share the listening port through SO_REUSEPORT, so kernel
+    # balances incoming connections between them
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    processes = [
+        context.Process(
+            target=run_worker,
+            args=(results,),
+            name=f'Worker-{number}',
+        )
+        for number in range(workers)
+    ]
+    for process in processes:
+        process.start()
+
+    def stop_workers(*args: Any) -> None:
+        logger.info('Graceful stopping workers...')
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+    signal.signal(signal.SIGINT, stop_workers)
+    signal.signal(signal.SIGTERM, stop_workers)
+    for process in processes:
+        process.join()
+    total_messages = total_bytes = 0
+    while not results.empty():
+        messages, bytes_count = results.get()
+        total_messages += messages
+        total_bytes += bytes_count
+    log_counters(total_messages, total_bytes, f'{workers} workers')
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Abstract telegram server')
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=WORKERS,
+        help='number of processes sharing listening port',
+    )
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    if args.workers > 1:
+        run_workers(args.workers)
+    else:
+        install_uvloop()
+        asyncio.run(serve())
+        log_counters(counters.messages, counters.bytes, 'Server')
@@ -0,0 +1,157 @@
+"""Compare Celery pools of notifications worker on the fan-out workload.
+
+Every pool consumes the same batch of send_text_messages tasks sent to fake
+telegram, which answers every message after a delay. Needs running broker
+from BROKER_URI (see src/celery_app/config.py), gevent pool is measured only
+when gevent is installed. Run from the root of repo:
+
+    PYTHONPATH=src python dev_tools/benchmarks/notification_pools.py
+"""
+import asyncio
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+from celery_app.publisher import publish_tasks
+from celery_app.telegram import FRAME_HEADER, encode_frame
+
+HOST = '127.0.0.1'
+PORT = int(os.environ.get('BENCHMARK_TELEGRAM_PORT', 54329))
+LATENCY = float(os.environ.get('BENCHMARK_TELEGRAM_LATENCY', 0.005))
+TASKS = int(os.environ.get('BENCHMARK_TASKS', 200))
+CHUNK_SIZE = int(os.environ.get('BENCHMARK_CHUNK_SIZE', 100))
+POOLS = [('prefork', 8), ('threads', 64), ('gevent', 256)]
+SRC = Path(__file__).resolve().parents[2] / 'src'
+
+
+class FakeTelegram:
+
+    def __init__(self) -> None:
+        self.messages = 0
+
+    async def handle_connection(
+            self,
+            reader: asyncio.StreamReader,
+            writer: asyncio.StreamWriter,
+    ) -> None:
+        try:
+            while True:
+                header = await reader.readexactly(FRAME_HEADER.size)
+                (size,) = FRAME_HEADER.unpack(header)
+                message = json.loads(await reader.readexactly(size))
+                await asyncio.sleep(LATENCY)
+                self.messages += 1
+                writer.write(
+                    encode_frame({'id': message['id'], 'status': 'accepted'}),
+                )
+        except (asyncio.IncompleteReadError, ConnectionError):
+            writer.close()
+
+    async def serve(self) -> None:
+        server = await asyncio.start_server(self.handle_connection, HOST, PORT)
+        async with server:
+            await server.serve_forever()
+
+
+def rss_megabytes(pid: int) -> float:
+    # Resident memory of worker process with all its children
+    rss = 0
+    pids = [pid]
+    while pids:
+        current = pids.pop()
+        try:
+            status = Path(f'/proc/{current}/status').read_text()
+            children = Path(
+                f'/proc/{current}/task/{current}/children',
+            ).read_text()
+        except FileNotFoundError:
+            continue
+        for line in status.splitlines():
+            if line.startswith('VmRSS:'):
+                rss += int(line.split()[1])
+        pids.extend(int(child) for child in children.split())
+    return rss / 1024
+
+
+def start_worker(pool: str, concurrency: int) -> subprocess.Popen:
+    worker = subprocess.Popen(
+        [
+            sys.executable, '-m', 'celery', '-A', 'celery_app', 'worker',
+            '--queues=notifications', f'--hostname=benchmark-{pool}@%h',
+            f'--pool={pool}', f'--concurrency={concurrency}',
+            '--without-gossip', '--without-mingle', '--without-heartbeat',
+            '--loglevel=INFO',
+        ],
+        cwd=SRC,
+        env={
+            **os.environ,
+            'ABSTRACT_TELEGRAM_HOST': HOST,
+            'ABSTRACT_TELEGRAM_PORT': str(PORT),
+            'ABSTRACT_TELEGRAM_POOL_SIZE': str(concurrency),
+            'TELEGRAM_RATE_LIMIT': '0',
+            'TELEGRAM_DESTINATION_RATE_LIMIT': '0',
+        },
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    assert worker.stderr is not None
+    for line in worker.stderr:
+        if 'ready.' in line:
+            break
+    # The rest of log is drained, so worker doesn't block on full pipe
+    threading.Thread(target=worker.stderr.read, daemon=True).start()
+    return worker
+
+
+def measure(telegram: FakeTelegram, pool: str, concurrency: int) -> None:
+    worker = start_worker(pool, concurrency)
+    expected = telegram.messages + TASKS * CHUNK_SIZE
+    started_at = time.perf_counter()
+    publish_tasks(
+        [
+            (
+                'send_text_messages',
+                [
+                    'benchmark',
+                    [f'@user{number}' for number in range(CHUNK_SIZE)],
+                ],
+            )
+            for _ in range(TASKS)
+        ],
+    )
+    peak_rss = 0.0
+    while telegram.messages < expected:
+        peak_rss = max(peak_rss, rss_megabytes(worker.pid))
+        time.sleep(0.1)
+    elapsed = time.perf_counter() - started_at
+    worker.terminate()
+    worker.wait()
+    print(
+        f'{pool} x{concurrency}: '
+        f'{TASKS * CHUNK_SIZE / elapsed:.0f} messages/s, '
+        f'peak RSS {peak_rss:.0f} MB',
+    )
+
+
+def main() -> None:
+    telegram = FakeTelegram()
+    threading.Thread(
+        target=asyncio.run,
+        args=(telegram.serve(),),
+        daemon=True,
+    ).start()
+    for pool, concurrency in POOLS:
+        if pool == 'gevent' and importlib.util.find_spec('gevent') is None:
+            print('gevent is not installed, skipped')
+            continue
+        measure(telegram, pool, concurrency)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""Compare serializing TODO lists by FastAPI with the fast response path.
+
+FastAPI validates returned documents by response model and dumps them by
+json, the fast path converts them by prebuilt serializer and dumps by orjson.
+Doesn't need database. Run from the root of repo:
+
+    PYTHONPATH=src python dev_tools/benchmarks/serialization.py
+"""
+import asyncio
+import json
+import os
+import time
+from typing import Callable
+from uuid import uuid4
+
+from bson import Binary, ObjectId
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from orjson import dumps
+
+from todo_list.schemes.response import TODOListResponseScheme
+from todo_list.serializers import serialize_todo_list
+
+TODO_LISTS = int(os.environ.get('BENCHMARK_TODO_LISTS', 10000))
+REPEATS = int(os.environ.get('BENCHMARK_REPEATS', 20))
+
+
+def measure(serialize: Callable[[], bytes]) -> float:
+    started_at = time.perf_counter()
+    for _ in range(REPEATS):
+        serialize()
+    return (time.perf_counter() - started_at) / REPEATS * 1000
+
+
+def main() -> None:
+    # Documents as they are read by find_todo_lists projection
+    todo_lists = [
+        {
+            '_id': ObjectId(),
+            'uuid': Binary.from_uuid(uuid4()),
+            'name': f'list{number}',
+            'task_count': number,
+            'completed_count': 0,
+            'revision': 0,
+        }
+        for number in range(TODO_LISTS)
+    ]
+    field = create_response_field(
+        name='response',
+        type_=list[TODOListResponseScheme],
+    )
+
+    def serialize_fastapi() -> bytes:
+        content = asyncio.run(
+            serialize_response(field=field, response_content=todo_lists),
+        )
+        return json.dumps(content).encode()
+
+    def serialize_fast() -> bytes:
+        return dumps([serialize_todo_list(item) for item in todo_lists])
+
+    assert json.loads(serialize_fastapi()) == json.loads(serialize_fast())
+    fastapi_ms = measure(serialize_fastapi)
+    fast_ms = measure(serialize_fast)
+    print(
+        f'{TODO_LISTS} TODO lists: response model {fastapi_ms:.1f} ms, '
+        f'fast path {fast_ms:.1f} ms ({fastapi_ms / fast_ms:.1f}x)',
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""Compare reading TODO lists through ODMantic with the projection path.
+
+Needs running MongoDB from MONGO_URI (see src/settings.py). Run from the
+root of repo:
+
+    PYTHONPATH=src python dev_tools/benchmarks/todo_list_reads.py
+"""
+import asyncio
+import datetime
+import os
+import time
+from typing import Awaitable, Callable
+
+from database import mongo_client
+from odmantic import AIOEngine
+from odmantic.session import AIOSession
+
+from todo_list.models import TODOList, User
+from todo_list.queries import find_todo_lists
+
+DATABASE = os.environ.get('BENCHMARK_DATABASE', 'benchmark')
+USERS = int(os.environ.get('BENCHMARK_USERS', 100))
+TODO_LISTS_PER_USER = int(os.environ.get('BENCHMARK_TODO_LISTS_PER_USER', 100))
+REPEATS = int(os.environ.get('BENCHMARK_REPEATS', 20))
+
+
+async def seed(engine: AIOEngine) -> list[User]:
+    users = [
+        User(
+            username=f'user{number}',
+            password='x' * 60,  # about the size of bcrypt hash
+            telegram=f'@user{number}',
+            last_seen=datetime.datetime.now(),
+            is_superuser=number == 0,
+        )
+        for number in range(USERS)
+    ]
+    await engine.save_all(users)
+    await engine.save_all(
+        [
+            TODOList(name=f'list{number}', user=user)
+            for user in users
+            for number in range(TODO_LISTS_PER_USER)
+        ],
+    )
+    return users
+
+
+async def measure(read: Callable[[], Awaitable[list]]) -> float:
+    started_at = time.perf_counter()
+    for _ in range(REPEATS):
+        await read()
+    return (time.perf_counter() - started_at) / REPEATS * 1000
+
+
+async def main() -> None:
+    engine = AIOEngine(client=mongo_client, database=DATABASE)
+    await mongo_client.drop_database(DATABASE)
+    users = await seed(engine)
+    admin, user = users[0], users[1]
+    async with engine.session() as session:
+        for title, reader in [('superuser', admin), ('common user', user)]:
+            await compare(session, title, reader)
+    await mongo_client.drop_database(DATABASE)
+
+
+async def compare(session: AIOSession, title: str, reader: User) -> None:
+    async def read_models() -> list:
+        if reader.is_superuser:
+            return await session.find(TODOList, sort=TODOList.id)
+        return await session.find(
+            TODOList,
+            TODOList.user == reader.id,
+            sort=TODOList.id,
+        )
+
+    async def read_projection() -> list:
+        return await find_todo_lists(session, reader).to_list(length=None)
+
+    models_ms = await measure(read_models)
+    projection_ms = await measure(read_projection)
+    print(
+        f'{title}: ODMantic find with $lookup {models_ms:.1f} ms, '
+        f'projection {projection_ms:.1f} ms '
+        f'({models_ms / projection_ms:.1f}x)',
+    )
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
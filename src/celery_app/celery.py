@@ -1,4 +1,5 @@
 from celery import Celery
+from celery_app import metrics  # noqa: F401 (connects signals)
 
 app = Celery('celery_app')
 app.config_from_object('celery_app.config')
@@ -0,0 +1,60 @@
+from redis import Redis
+
+OPEN_KEY = 'circuit:{name}:open'
+TRIPPED_KEY = 'circuit:{name}:tripped'
+PROBE_KEY = 'circuit:{name}:probe'
+FAILURES_KEY = 'circuit:{name}:failures'
+
+
+class CircuitBreaker:
+    # State is kept in Redis, so all worker processes stop calling a dead
+    # service together. After open period a single probe call is allowed,
+    # its result closes or opens circuit again
+
+    def __init__(
+            self,
+            redis: Redis,
+            name: str,
+            failure_threshold: int,
+            failure_window: int,
+            open_seconds: int,
+    ) -> None:
+        self.redis = redis
+        self.failure_threshold = failure_threshold
+        self.failure_window = failure_window
+        self.open_seconds = open_seconds
+        self.open_key = OPEN_KEY.format(name=name)
+        self.tripped_key = TRIPPED_KEY.format(name=name)
+        self.probe_key = PROBE_KEY.format(name=name)
+        self.failures_key = FAILURES_KEY.format(name=name)
+
+    def retry_after(self) -> float:
+        # Returns 0 if call is allowed, otherwise seconds to wait for
+        with self.redis.pipeline(transaction=False) as pipeline:
+            pipeline.pttl(self.open_key)
+            pipeline.exists(self.tripped_key)
+            open_ttl, tripped = pipeline.execute()
+        if open_ttl > 0:
+            return open_ttl / 1000
+        if not tripped:
+            return 0
+        if self.redis.set(self.probe_key, 1, nx=True, ex=self.open_seconds):
+            return 0
+        return self.open_seconds
+
+    def record_success(self) -> None:
+        self.redis.delete(self.failures_key, self.tripped_key, self.probe_key)
+
+    def record_failure(self) -> None:
+        with self.redis.pipeline() as pipeline:
+            pipeline.incr(self.failures_key)
+            pipeline.expire(self.failures_key, self.failure_window)
+            pipeline.exists(self.tripped_key)
+            failures, _, tripped = pipeline.execute()
+        if failures < self.failure_threshold and not tripped:
+            return
+        with self.redis.pipeline() as pipeline:
+            pipeline.set(self.open_key, 1, ex=self.open_seconds)
+            pipeline.set(self.tripped_key, 1)
+            pipeline.delete(self.failures_key, self.probe_key)
+            pipeline.execute()
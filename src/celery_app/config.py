@@ -1,5 +1,8 @@
 import os
 
+from celery_app.settings import COUNTERS_REPAIR_INTERVAL
+from kombu import Queue
+
 broker_url = os.environ.get('BROKER_URI', 'redis://localhost:6379/0')
 
 task_serializer = 'json'
@@ -7,7 +10,40 @@ result_serializer = 'json'
 accept_content = ['json']
 timezone = 'Europe/Moscow'
 enable_utc = True
-task_annotations = {
-    'tasks.send_message_about_deleting': {'rate_limit': '60/m'},
-}
 include = ['celery_app.tasks']
+
+# Notifications are consumed by their own I/O-bound worker, so heavy tasks
+# can't delay them and vice versa
+task_queues = (
+    Queue('default'),
+    Queue('notifications'),
+    Queue('maintenance'),
+)
+task_default_queue = 'default'
+task_routes = {
+    'notify_about_deleting': {'queue': 'notifications'},
+    'send_notification_digest': {'queue': 'notifications'},
+    'send_text_messages': {'queue': 'notifications'},
+    'send_message_about_deleting': {'queue': 'notifications'},
+    'delete_todo_list_tasks': {'queue': 'maintenance'},
+    'repair_task_counters': {'queue': 'maintenance'},
+}
+# Tasks are acknowledged after they are done, so tasks of killed worker are
+# redelivered. Process reserves only the task it runs, so long maintenance
+# tasks don't hold waiting ones. Threaded notifications worker sets its own
+# multiplier in supervisord.conf
+task_acks_late = True
+task_reject_on_worker_lost = True
+worker_prefetch_multiplier = int(
+    os.environ.get('CELERY_PREFETCH_MULTIPLIER', 1),
+)
+# Denormalized counters of TODO lists drift when concurrent writes race, so
+# they are repaired periodically. Run missed while workers are down expires
+# instead of piling up
+beat_schedule = {
+    'repair-task-counters': {
+        'task': 'repair_task_counters',
+        'schedule': COUNTERS_REPAIR_INTERVAL,
+        'options': {'expires': COUNTERS_REPAIR_INTERVAL},
+    },
+}
@@ -0,0 +1,34 @@
+import logging
+from typing import Any
+
+from celery.signals import worker_init
+from metrics import mongo_event_listeners
+from odmantic import SyncEngine
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+from settings import DATABASE, MONGO_URI
+
+from todo_list.models import configure_models
+
+logger = logging.getLogger(__name__)
+
+mongo_client: MongoClient = MongoClient(
+    MONGO_URI,
+    event_listeners=mongo_event_listeners(),
+)
+mongo_engine = SyncEngine(client=mongo_client, database=DATABASE)
+
+
+@worker_init.connect
+def configure_database(**kwargs: Any) -> None:
+    # Tasks rely on indexes of models (notify_about_deleting hints one of
+    # them), so worker doesn't wait for API to create them. Main process
+    # uses its own client, pymongo clients must not be shared with forked
+    # pool processes
+    client: MongoClient
+    with MongoClient(MONGO_URI) as client:
+        try:
+            configure_models(SyncEngine(client=client, database=DATABASE))
+        except PyMongoError as exc:
+            # Worker still serves tasks which don't need database
+            logger.warning(f'Indexes of models are not configured: {exc}')
@@ -0,0 +1,52 @@
+from collections import defaultdict
+from typing import Iterable
+
+from celery_app.settings import (
+    DIGEST_ITEM_TEMPLATE,
+    DIGEST_MESSAGE_TEMPLATE,
+    MESSAGE_TEMPLATE,
+)
+
+DIGEST_KEY = 'notifications:digest'
+DIGEST_SCHEDULED_KEY = 'notifications:digest:scheduled'
+
+
+def format_digest(deletions: list[dict]) -> str:
+    if len(deletions) == 1:
+        return MESSAGE_TEMPLATE.format(
+            username=deletions[0]['username'],
+            todo_list_name=deletions[0]['name'],
+        )
+    return DIGEST_MESSAGE_TEMPLATE.format(
+        todo_lists='\n'.join(
+            DIGEST_ITEM_TEMPLATE.format(
+                username=deletion['username'],
+                todo_list_name=deletion['name'],
+            )
+            for deletion in deletions
+        ),
+    )
+
+
+def group_by_digest(
+        deletions: list[dict],
+        recipients: Iterable[dict],
+) -> dict[str, list[str]]:
+    # Almost all recipients get the same digest, only owners of deleted
+    # lists aren't notified about their own lists
+    owners = {deletion['owner_id'] for deletion in deletions}
+    common_digest = format_digest(deletions)
+    telegrams: dict[str, list[str]] = defaultdict(list)
+    for recipient in recipients:
+        recipient_id = str(recipient['_id'])
+        if recipient_id not in owners:
+            telegrams[common_digest].append(recipient['telegram'])
+            continue
+        others = [
+            deletion
+            for deletion in deletions
+            if deletion['owner_id'] != recipient_id
+        ]
+        if others:
+            telegrams[format_digest(others)].append(recipient['telegram'])
+    return telegrams
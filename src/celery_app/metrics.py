@@ -0,0 +1,107 @@
+import os
+import time
+from typing import Any
+
+from celery import Task
+from celery.signals import (
+    after_task_publish,
+    task_failure,
+    task_postrun,
+    task_prerun,
+    task_retry,
+    worker_process_shutdown,
+    worker_ready,
+)
+from celery_app.settings import CELERY_METRICS_PORT
+from prometheus_client import (
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    REGISTRY,
+    multiprocess,
+    start_http_server,
+)
+
+TASKS_PUBLISHED = Counter(
+    'celery_tasks_published',
+    'Celery tasks published to broker',
+    ['task', 'queue'],
+)
+TASK_SECONDS = Histogram(
+    'celery_task_seconds',
+    'Time of running Celery task',
+    ['task', 'state'],
+)
+TASK_FAILURES = Counter(
+    'celery_task_failures',
+    'Celery tasks failed by exception',
+    ['task', 'exception'],
+)
+TASK_RETRIES = Counter(
+    'celery_task_retries',
+    'Celery tasks scheduled to be retried',
+    ['task'],
+)
+# Start times of running tasks by their ids. Tasks of threads pool run
+# concurrently in one process, so a single value isn't enough
+task_started_at: dict[str, float] = {}
+
+
+@after_task_publish.connect
+def count_published_task(
+        sender: str,
+        routing_key: str,
+        **kwargs: Any,
+) -> None:
+    TASKS_PUBLISHED.labels(sender, routing_key).inc()
+
+
+@task_prerun.connect
+def start_task_timer(task_id: str, **kwargs: Any) -> None:
+    task_started_at[task_id] = time.perf_counter()
+
+
+@task_postrun.connect
+def observe_task_time(
+        task_id: str,
+        task: Task,
+        state: str | None = None,
+        **kwargs: Any,
+) -> None:
+    started_at = task_started_at.pop(task_id, None)
+    if started_at is None:
+        return
+    TASK_SECONDS.labels(task.name, state or 'UNKNOWN').observe(
+        time.perf_counter() - started_at,
+    )
+
+
+@task_failure.connect
+def count_task_failure(
+        sender: Task,
+        exception: BaseException,
+        **kwargs: Any,
+) -> None:
+    TASK_FAILURES.labels(sender.name, type(exception).__name__).inc()
+
+
+@task_retry.connect
+def count_task_retry(sender: Task, **kwargs: Any) -> None:
+    TASK_RETRIES.labels(sender.name).inc()
+
+
+@worker_ready.connect
+def start_metrics_server(**kwargs: Any) -> None:
+    if not CELERY_METRICS_PORT:
+        return
+    registry = REGISTRY
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    start_http_server(CELERY_METRICS_PORT, registry=registry)
+
+
+@worker_process_shutdown.connect
+def mark_process_dead(pid: int, **kwargs: Any) -> None:
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        multiprocess.mark_process_dead(pid)
@@ -0,0 +1,116 @@
+import datetime
+import logging
+import signal
+import time
+from typing import Any
+
+from celery_app.database import mongo_engine
+from celery_app.publisher import publish_tasks
+from celery_app.settings import (
+    OUTBOX_BATCH_SIZE,
+    OUTBOX_METRICS_PORT,
+    OUTBOX_POLL_INTERVAL,
+)
+from prometheus_client import start_http_server
+from pymongo import UpdateOne
+
+from todo_list.models import OutboxMessage, TODOList
+
+logger = logging.getLogger(__name__)
+
+
+class GracefulKiller:
+    kill_now = False
+
+    def __init__(self) -> None:
+        signal.signal(signal.SIGINT, self.exit_gracefully)
+        signal.signal(signal.SIGTERM, self.exit_gracefully)
+
+    def exit_gracefully(self, *args: Any) -> None:
+        logger.info('Graceful stopping...')
+        self.kill_now = True
+
+
+def move_todo_list_messages() -> int:
+    # Deleted TODO lists keep their messages in the list document, because
+    # standalone server can't write them to outbox in the same transaction
+    todo_lists = mongo_engine.get_collection(TODOList)
+    pending = list(
+        todo_lists.find(
+            {'is_deleted': True, 'outbox': {'$exists': True}},
+            {'outbox': True},
+            limit=OUTBOX_BATCH_SIZE,
+        ),
+    )
+    if not pending:
+        return 0
+    messages = [
+        message for todo_list in pending for message in todo_list['outbox']
+    ]
+    # Upsert by _id doesn't duplicate messages moved again after a crash
+    # before the lists are unset
+    mongo_engine.get_collection(OutboxMessage).bulk_write(
+        [
+            UpdateOne(
+                {'_id': message['_id']},
+                {
+                    '$setOnInsert': {
+                        key: value
+                        for key, value in message.items()
+                        if key != '_id'
+                    },
+                },
+                upsert=True,
+            )
+            for message in messages
+        ],
+    )
+    todo_lists.update_many(
+        {'_id': {'$in': [todo_list['_id'] for todo_list in pending]}},
+        {'$unset': {'outbox': True}},
+    )
+    return len(messages)
+
+
+def relay_batch() -> int:
+    outbox = mongo_engine.get_collection(OutboxMessage)
+    messages = list(
+        outbox.find(
+            {'published_at': None},
+            {'task': True, 'args': True},
+            sort=[('_id', 1)],
+            limit=OUTBOX_BATCH_SIZE,
+        ),
+    )
+    if not messages:
+        return 0
+    # Messages are marked only after publishing, so a crash in between
+    # publishes them again (at least once delivery)
+    publish_tasks([(message['task'], message['args']) for message in messages])
+    outbox.update_many(
+        {'_id': {'$in': [message['_id'] for message in messages]}},
+        {'$set': {'published_at': datetime.datetime.utcnow()}},
+    )
+    return len(messages)
+
+
+def run_relay() -> None:
+    killer = GracefulKiller()
+    if OUTBOX_METRICS_PORT:
+        start_http_server(OUTBOX_METRICS_PORT)
+    logger.info('Outbox relay started')
+    while not killer.kill_now:
+        moved = move_todo_list_messages()
+        published = relay_batch()
+        if published:
+            logger.info(f'Published {published} messages from outbox')
+        if moved < OUTBOX_BATCH_SIZE and published < OUTBOX_BATCH_SIZE:
+            time.sleep(OUTBOX_POLL_INTERVAL)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(
+        format='%(asctime)s [%(levelname)s] %(name)s: %(message)s',
+        level=logging.INFO,
+    )
+    run_relay()
@@ -0,0 +1,25 @@
+import time
+
+from celery_app.celery import app
+from prometheus_client import Histogram
+
+PUBLISH_SECONDS = Histogram(
+    'celery_publish_seconds',
+    'Time of publishing batch of Celery tasks to broker',
+)
+PUBLISH_BATCH_SIZE = Histogram(
+    'celery_publish_batch_size',
+    'Number of Celery tasks published to broker at once',
+    buckets=(1, 2, 5, 10, 50, 100, 500, 1000),
+)
+
+
+def publish_tasks(messages: list[tuple[str, list]]) -> None:
+    # The whole batch is published through one connection acquired from
+    # the pool of Celery app instead of a connection per task
+    started_at = time.perf_counter()
+    with app.producer_or_acquire() as producer:
+        for task, args in messages:
+            app.send_task(task, args=args, producer=producer)
+    PUBLISH_SECONDS.observe(time.perf_counter() - started_at)
+    PUBLISH_BATCH_SIZE.observe(len(messages))
@@ -0,0 +1,88 @@
+from redis import Redis
+
+# Takes up to ARGV[3] tokens from bucket refilled by ARGV[1] tokens per second
+# up to ARGV[2] tokens. Returns number of taken tokens and seconds until the
+# rest of them (but not more than burst) is available. Time of Redis is used,
+# so clocks of workers don't matter
+TAKE_TOKENS_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local requested = tonumber(ARGV[3])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'timestamp')
+local tokens = tonumber(bucket[1]) or burst
+local timestamp = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - timestamp) * rate)
+local taken = math.min(requested, math.floor(tokens))
+tokens = tokens - taken
+local wait = 0
+if taken < requested then
+    wait = (math.min(requested - taken, burst) - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'timestamp', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return {taken, tostring(wait)}
+"""
+GLOBAL_BUCKET_KEY = 'ratelimit:telegram'
+DESTINATION_BUCKET_KEY = 'ratelimit:telegram:{destination}'
+
+
+class TokenBucketLimiter:
+
+    def __init__(
+            self,
+            redis: Redis,
+            rate: float,
+            burst: int,
+            destination_rate: float,
+            destination_burst: int,
+    ) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.destination_rate = destination_rate
+        self.destination_burst = destination_burst
+        self.take_tokens = redis.register_script(TAKE_TOKENS_SCRIPT)
+        self.redis = redis
+
+    def acquire(
+            self,
+            destinations: list[str],
+    ) -> tuple[list[str], list[str], float]:
+        # Splits destinations into allowed to be sent now and deferred ones,
+        # the last are allowed to be retried after returned delay
+        deferred: list[str] = []
+        wait = 0.0
+        if self.rate:
+            taken, global_wait = self.take_tokens(
+                keys=[GLOBAL_BUCKET_KEY],
+                args=[self.rate, self.burst, len(destinations)],
+            )
+            if taken < len(destinations):
+                wait = float(global_wait)
+            destinations, deferred = destinations[:taken], destinations[taken:]
+        if not self.destination_rate or not destinations:
+            return destinations, deferred, wait
+        # Global tokens taken for destinations rejected here are lost, so
+        # limits are never exceeded but may be underused
+        with self.redis.pipeline(transaction=False) as pipeline:
+            for destination in destinations:
+                self.take_tokens(
+                    keys=[
+                        DESTINATION_BUCKET_KEY.format(destination=destination),
+                    ],
+                    args=[self.destination_rate, self.destination_burst, 1],
+                    client=pipeline,
+                )
+            results = pipeline.execute()
+        allowed = []
+        for destination, (taken, destination_wait) in zip(
+                destinations,
+                results,
+        ):
+            if taken:
+                allowed.append(destination)
+            else:
+                deferred.append(destination)
+                wait = max(wait, float(destination_wait))
+        return allowed, deferred, wait
@@ -0,0 +1,8 @@
+from celery_app.celery import app
+from redis import Redis
+from settings import REDIS_URI
+
+# Redis of broker keeps state shared by all workers
+redis_client = Redis.from_url(app.conf.broker_url)
+# Redis of response cache of API, see todo_list.response_cache
+cache_redis_client = Redis.from_url(REDIS_URI)
@@ -8,9 +8,87 @@ if not is_ip_address(ABSTRACT_TELEGRAM_HOST):
     ABSTRACT_TELEGRAM_HOST = socket.gethostbyname(ABSTRACT_TELEGRAM_HOST)
     print(f'ABSTRACT_TELEGRAM_HOST={ABSTRACT_TELEGRAM_HOST}')
 ABSTRACT_TELEGRAM_PORT = int(os.environ.get('ABSTRACT_TELEGRAM_PORT', 54321))
+ABSTRACT_TELEGRAM_CONNECT_TIMEOUT = float(
+    os.environ.get('ABSTRACT_TELEGRAM_CONNECT_TIMEOUT', 3),
+)
+ABSTRACT_TELEGRAM_READ_TIMEOUT = float(
+    os.environ.get('ABSTRACT_TELEGRAM_READ_TIMEOUT', 10),
+)
+# Idle connections kept open by every worker process
+ABSTRACT_TELEGRAM_POOL_SIZE = int(
+    os.environ.get('ABSTRACT_TELEGRAM_POOL_SIZE', 4),
+)
+# Messages written to a connection before waiting for their responses
+ABSTRACT_TELEGRAM_PIPELINE_SIZE = int(
+    os.environ.get('ABSTRACT_TELEGRAM_PIPELINE_SIZE', 50),
+)
 MESSAGE_TEMPLATE = (
     'Пользователь {username} посмел создать TODO лист с оскорбительным '
     'названием {todo_list_name}. Мы успешно удалили этот TODO List, а '
     'пользователь {username} получает звание дурака!'
 )
-ABSTRACT_TELEGRAM_SUCCESS_RESPONSE = {'status': 'accepted'}
+ABSTRACT_TELEGRAM_SUCCESS_STATUS = 'accepted'
+# How many recipients are read from Mongo per cursor batch and how many of
+# them are sent by a single Celery task
+NOTIFICATION_BATCH_SIZE = int(os.environ.get('NOTIFICATION_BATCH_SIZE', 1000))
+NOTIFICATION_CHUNK_SIZE = int(os.environ.get('NOTIFICATION_CHUNK_SIZE', 100))
+# Tasks of deleted TODO list are removed by batches with pause between them
+CASCADE_DELETE_BATCH_SIZE = int(
+    os.environ.get('CASCADE_DELETE_BATCH_SIZE', 1000),
+)
+CASCADE_DELETE_COUNTDOWN = float(
+    os.environ.get('CASCADE_DELETE_COUNTDOWN', 0.5),
+)
+# TODO lists whose task counters are rewritten by a single bulk write
+COUNTERS_REPAIR_BATCH_SIZE = int(
+    os.environ.get('COUNTERS_REPAIR_BATCH_SIZE', 1000),
+)
+# Period of repair_task_counters scheduled by celery beat
+COUNTERS_REPAIR_INTERVAL = float(
+    os.environ.get('COUNTERS_REPAIR_INTERVAL', 3600),
+)  # seconds
+# Outbox relay publishes up to this number of messages at once and sleeps
+# between polls when outbox is drained. Published messages are removed
+# after retention period
+OUTBOX_BATCH_SIZE = int(os.environ.get('OUTBOX_BATCH_SIZE', 500))
+OUTBOX_POLL_INTERVAL = float(os.environ.get('OUTBOX_POLL_INTERVAL', 1))
+# Deletions made within this number of seconds are sent to every recipient
+# as one digest message, 0 sends a message per deletion
+NOTIFICATION_DIGEST_WINDOW = int(
+    os.environ.get('NOTIFICATION_DIGEST_WINDOW', 0),
+)
+DIGEST_MESSAGE_TEMPLATE = (
+    'Администраторы удалили TODO листы с оскорбительными названиями, а их '
+    'владельцы получают звание дурака:\n{todo_lists}'
+)
+DIGEST_ITEM_TEMPLATE = '- {todo_list_name} (пользователь {username})'
+# Limits of messages sent to telegram by all workers together: messages per
+# second and burst size, overall and for every recipient. 0 disables limit
+TELEGRAM_RATE_LIMIT = float(os.environ.get('TELEGRAM_RATE_LIMIT', 100))
+TELEGRAM_RATE_BURST = int(os.environ.get('TELEGRAM_RATE_BURST', 200))
+TELEGRAM_DESTINATION_RATE_LIMIT = float(
+    os.environ.get('TELEGRAM_DESTINATION_RATE_LIMIT', 1),
+)
+TELEGRAM_DESTINATION_RATE_BURST = int(
+    os.environ.get('TELEGRAM_DESTINATION_RATE_BURST', 5),
+)
+# Sending to telegram is retried on timeouts and connection errors with
+# exponential backoff (seconds) and full jitter
+TELEGRAM_MAX_RETRIES = int(os.environ.get('TELEGRAM_MAX_RETRIES', 5))
+TELEGRAM_RETRY_BACKOFF = int(os.environ.get('TELEGRAM_RETRY_BACKOFF', 2))
+TELEGRAM_RETRY_BACKOFF_MAX = int(
+    os.environ.get('TELEGRAM_RETRY_BACKOFF_MAX', 300),
+)
+# Circuit breaker of telegram opens after this number of failures within
+# window (seconds) and stays open for given number of seconds
+CIRCUIT_FAILURE_THRESHOLD = int(
+    os.environ.get('CIRCUIT_FAILURE_THRESHOLD', 5),
+)
+CIRCUIT_FAILURE_WINDOW = int(os.environ.get('CIRCUIT_FAILURE_WINDOW', 30))
+CIRCUIT_OPEN_SECONDS = int(os.environ.get('CIRCUIT_OPEN_SECONDS', 30))
+# Worker serves its metrics on this port, 0 disables it. Prefork worker
+# needs PROMETHEUS_MULTIPROC_DIR to collect metrics of its child processes
+CELERY_METRICS_PORT = int(os.environ.get('CELERY_METRICS_PORT', 0))
+# Outbox relay serves its metrics (published tasks) on this port, 0
+# disables it
+OUTBOX_METRICS_PORT = int(os.environ.get('OUTBOX_METRICS_PORT', 0))
@@ -1,37 +1,353 @@
 import json
-import socket
 
+from bson import ObjectId
+from celery import Task as CeleryTask
+from celery import group
+from celery.utils.time import get_exponential_backoff_interval
 from celery_app.celery import app
+from celery_app.circuit import CircuitBreaker
+from celery_app.database import mongo_engine
+from celery_app.digest import DIGEST_KEY, DIGEST_SCHEDULED_KEY, group_by_digest
+from celery_app.ratelimit import TokenBucketLimiter
+from celery_app.redis_client import cache_redis_client, redis_client
 from celery_app.settings import (
-    ABSTRACT_TELEGRAM_HOST,
-    ABSTRACT_TELEGRAM_PORT,
-    ABSTRACT_TELEGRAM_SUCCESS_RESPONSE,
+    ABSTRACT_TELEGRAM_SUCCESS_STATUS,
+    CASCADE_DELETE_BATCH_SIZE,
+    CASCADE_DELETE_COUNTDOWN,
+    CIRCUIT_FAILURE_THRESHOLD,
+    CIRCUIT_FAILURE_WINDOW,
+    CIRCUIT_OPEN_SECONDS,
+    COUNTERS_REPAIR_BATCH_SIZE,
     MESSAGE_TEMPLATE,
+    NOTIFICATION_BATCH_SIZE,
+    NOTIFICATION_CHUNK_SIZE,
+    NOTIFICATION_DIGEST_WINDOW,
+    TELEGRAM_DESTINATION_RATE_BURST,
+    TELEGRAM_DESTINATION_RATE_LIMIT,
+    TELEGRAM_MAX_RETRIES,
+    TELEGRAM_RATE_BURST,
+    TELEGRAM_RATE_LIMIT,
+    TELEGRAM_RETRY_BACKOFF,
+    TELEGRAM_RETRY_BACKOFF_MAX,
 )
+from celery_app.telegram import get_telegram_pool
+from celery_app.utils import chunked
+from pymongo import UpdateOne
+from settings import RESPONSE_CACHE_BACKEND
 
+from todo_list.models import RECIPIENTS_INDEX, TODOList, Task, User
+from todo_list.response_cache import (
+    GENERATION_KEY,
+    SUPERUSER_SCOPE,
+    user_scope,
+)
 
-@app.task(name='send_message_about_deleting')
-def send_message_about_deleting(
+telegram_limiter = TokenBucketLimiter(
+    redis_client,
+    TELEGRAM_RATE_LIMIT,
+    TELEGRAM_RATE_BURST,
+    TELEGRAM_DESTINATION_RATE_LIMIT,
+    TELEGRAM_DESTINATION_RATE_BURST,
+)
+telegram_breaker = CircuitBreaker(
+    redis_client,
+    'telegram',
+    CIRCUIT_FAILURE_THRESHOLD,
+    CIRCUIT_FAILURE_WINDOW,
+    CIRCUIT_OPEN_SECONDS,
+)
+
+
+@app.task(name='notify_about_deleting')
+def notify_about_deleting(owner_id: str, name_deleted_todo_list: str) -> None:
+    owner = mongo_engine.find_one(User, User.id == ObjectId(owner_id))
+    if owner is None:
+        return
+    username = owner.username
+    if NOTIFICATION_DIGEST_WINDOW:
+        add_to_digest(owner_id, username, name_deleted_todo_list)
+        return
+    # Query is answered by index only, documents of users aren't fetched
+    recipients = mongo_engine.get_collection(User).find(
+        {'_id': {'$ne': ObjectId(owner_id)}},
+        {'_id': False, 'telegram': True},
+        batch_size=NOTIFICATION_BATCH_SIZE,
+        hint=RECIPIENTS_INDEX,
+    )
+    message = MESSAGE_TEMPLATE.format(
+        username=username,
+        todo_list_name=name_deleted_todo_list,
+    )
+    telegrams = (recipient['telegram'] for recipient in recipients)
+    for batch in chunked(telegrams, NOTIFICATION_BATCH_SIZE):
+        group(
+            send_text_messages.s(message, chunk)
+            for chunk in chunked(batch, NOTIFICATION_CHUNK_SIZE)
+        ).apply_async()
+
+
+def add_to_digest(
+        owner_id: str,
         username: str,
         name_deleted_todo_list: str,
-        telegram: str,
 ) -> None:
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as abs_telegram:
-        abs_telegram.connect((ABSTRACT_TELEGRAM_HOST, ABSTRACT_TELEGRAM_PORT))
-        abs_telegram.sendall(
-            json.dumps(
-                {
-                    'telegram': telegram,
-                    'message': MESSAGE_TEMPLATE.format(
-                        username=username,
-                        todo_list_name=name_deleted_todo_list,
-                    ),
+    redis_client.rpush(
+        DIGEST_KEY,
+        json.dumps(
+            {
+                'owner_id': owner_id,
+                'username': username,
+                'name': name_deleted_todo_list,
+            },
+        ),
+    )
+    # Only the first deletion in window schedules sending of digest. Flag
+    # expires anyway in case the scheduled task is lost
+    if redis_client.set(
+            DIGEST_SCHEDULED_KEY,
+            1,
+            nx=True,
+            ex=NOTIFICATION_DIGEST_WINDOW * 2,
+    ):
+        send_notification_digest.apply_async(
+            countdown=NOTIFICATION_DIGEST_WINDOW,
+        )
+
+
+@app.task(name='send_notification_digest')
+def send_notification_digest() -> None:
+    with redis_client.pipeline() as pipeline:
+        pipeline.lrange(DIGEST_KEY, 0, -1)
+        pipeline.delete(DIGEST_KEY, DIGEST_SCHEDULED_KEY)
+        digest, _ = pipeline.execute()
+    deletions = [json.loads(deletion) for deletion in digest]
+    if not deletions:
+        return
+    recipients = mongo_engine.get_collection(User).find(
+        {},
+        {'_id': True, 'telegram': True},
+        batch_size=NOTIFICATION_BATCH_SIZE,
+        hint=RECIPIENTS_INDEX,
+    )
+    for batch in chunked(recipients, NOTIFICATION_BATCH_SIZE):
+        group(
+            send_text_messages.s(text, chunk)
+            for text, telegrams in group_by_digest(deletions, batch).items()
+            for chunk in chunked(telegrams, NOTIFICATION_CHUNK_SIZE)
+        ).apply_async()
+
+
+@app.task(name='delete_todo_list_tasks', bind=True)
+def delete_todo_list_tasks(self: CeleryTask, todo_list_id: str) -> None:
+    # Every run removes one batch and schedules the next one instead of
+    # deleting everything at once, so foreground queries aren't starved
+    object_id = ObjectId(todo_list_id)
+    todo_lists = mongo_engine.get_collection(TODOList)
+    # Tasks of live list are never removed, whoever published the task
+    deleted = todo_lists.find_one(
+        {'_id': object_id, 'is_deleted': True},
+        {'_id': True},
+    )
+    if deleted is None:
+        return
+    tasks = mongo_engine.get_collection(Task)
+    batch = [
+        task['_id']
+        for task in tasks.find(
+            {'todo_list': object_id},
+            {'_id': True},
+            limit=CASCADE_DELETE_BATCH_SIZE,
+        )
+    ]
+    if batch:
+        tasks.delete_many({'_id': {'$in': batch}})
+    if len(batch) == CASCADE_DELETE_BATCH_SIZE:
+        self.apply_async((todo_list_id,), countdown=CASCADE_DELETE_COUNTDOWN)
+    else:
+        todo_lists.delete_one({'_id': object_id, 'is_deleted': True})
+
+
+@app.task(name='repair_task_counters')
+def repair_task_counters() -> None:
+    # Recomputes denormalized counters of all TODO lists, they may drift
+    # because tasks and their list are updated by separate operations
+    counters = mongo_engine.get_collection(Task).aggregate(
+        [
+            {
+                '$group': {
+                    '_id': '$todo_list',
+                    'task_count': {'$sum': 1},
+                    'completed_count': {
+                        '$sum': {'$cond': ['$is_complete', 1, 0]},
+                    },
                 },
-            ).encode('utf8'),
+            },
+        ],
+    )
+    todo_lists = mongo_engine.get_collection(TODOList)
+    counted: set[ObjectId] = set()
+    for batch in chunked(counters, COUNTERS_REPAIR_BATCH_SIZE):
+        counted.update(counter['_id'] for counter in batch)
+        stored = {
+            todo_list['_id']: todo_list
+            for todo_list in todo_lists.find(
+                {'_id': {'$in': [counter['_id'] for counter in batch]}},
+                {'user': True, 'task_count': True, 'completed_count': True},
+            )
+        }
+        # Only drifted lists are updated, so revisions (ETags) of correct
+        # lists stay the same
+        drifted = [
+            counter
+            for counter in batch
+            if counter['_id'] in stored and (
+                stored[counter['_id']].get('task_count'),
+                stored[counter['_id']].get('completed_count'),
+            ) != (counter['task_count'], counter['completed_count'])
+        ]
+        if not drifted:
+            continue
+        todo_lists.bulk_write(
+            [
+                UpdateOne(
+                    {
+                        '_id': counter['_id'],
+                        '$or': [
+                            {'task_count': {'$ne': counter['task_count']}},
+                            {
+                                'completed_count': {
+                                    '$ne': counter['completed_count'],
+                                },
+                            },
+                        ],
+                    },
+                    {
+                        '$set': {
+                            'task_count': counter['task_count'],
+                            'completed_count': counter['completed_count'],
+                        },
+                        '$inc': {'revision': 1},
+                    },
+                )
+                for counter in drifted
+            ],
+            ordered=False,
         )
-        data = abs_telegram.recv(1024)
-    response = json.loads(data.decode('utf8'))
-    if response != ABSTRACT_TELEGRAM_SUCCESS_RESPONSE:
+        invalidate_response_cache(
+            [stored[counter['_id']].get('user') for counter in drifted],
+        )
+    uncounted = todo_lists.find(
+        {
+            '$or': [
+                {'task_count': {'$ne': 0}},
+                {'completed_count': {'$ne': 0}},
+            ],
+        },
+        {'_id': True, 'user': True},
+    )
+    # Lists without tasks don't appear in aggregation at all
+    for batch in chunked(uncounted, COUNTERS_REPAIR_BATCH_SIZE):
+        empty = [
+            todo_list
+            for todo_list in batch
+            if todo_list['_id'] not in counted
+        ]
+        if empty:
+            todo_lists.update_many(
+                {'_id': {'$in': [todo_list['_id'] for todo_list in empty]}},
+                {
+                    '$set': {'task_count': 0, 'completed_count': 0},
+                    '$inc': {'revision': 1},
+                },
+            )
+            invalidate_response_cache(
+                [todo_list.get('user') for todo_list in empty],
+            )
+
+
+def invalidate_response_cache(owner_ids: list) -> None:
+    # Bumps the same generations as writes made through API, see
+    # todo_list.response_cache. Cache local to API processes can't be
+    # reached from here and is left to expire by TTL
+    if RESPONSE_CACHE_BACKEND != 'redis':
+        return
+    scopes = {user_scope(owner_id) for owner_id in owner_ids if owner_id}
+    with cache_redis_client.pipeline(transaction=False) as pipeline:
+        for scope in [*scopes, SUPERUSER_SCOPE]:
+            pipeline.incr(GENERATION_KEY.format(scope=scope))
+        pipeline.execute()
+
+
+def raise_for_statuses(
+        messages: list[tuple[str, str]],
+        statuses: list[str],
+) -> None:
+    failed = {
+        telegram: status
+        for (telegram, _), status in zip(messages, statuses)
+        if status != ABSTRACT_TELEGRAM_SUCCESS_STATUS
+    }
+    if failed:
         raise ValueError(
-            f'From telegram got unsuccessful response: {response}',
+            f'From telegram got unsuccessful responses: {failed}',
+        )
+
+
+@app.task(
+    name='send_text_messages',
+    bind=True,
+    max_retries=TELEGRAM_MAX_RETRIES,
+)
+def send_text_messages(
+        self: CeleryTask,
+        text: str,
+        telegrams: list[str],
+) -> None:
+    breaker_wait = telegram_breaker.retry_after()
+    if breaker_wait:
+        # Telegram is considered down, so the task is requeued at once
+        # instead of waiting for timeouts. It isn't counted as a retry
+        self.apply_async(
+            (text, telegrams),
+            countdown=breaker_wait,
+            retries=self.request.retries,
+        )
+        return
+    allowed, deferred, wait = telegram_limiter.acquire(telegrams)
+    if deferred:
+        # Task doesn't sleep while budget is exhausted, the rest of
+        # recipients is sent later by another task
+        self.apply_async((text, deferred), countdown=wait)
+    if not allowed:
+        return
+    messages = [(telegram, text) for telegram in allowed]
+    try:
+        statuses = get_telegram_pool().send_messages(messages)
+    except OSError as exc:
+        # Timeouts and connection errors, rejected messages aren't retried
+        telegram_breaker.record_failure()
+        raise self.retry(
+            args=(text, allowed),
+            exc=exc,
+            countdown=get_exponential_backoff_interval(
+                TELEGRAM_RETRY_BACKOFF,
+                self.request.retries,
+                TELEGRAM_RETRY_BACKOFF_MAX,
+                full_jitter=True,
+            ),
         )
+    telegram_breaker.record_success()
+    raise_for_statuses(messages, statuses)
+
+
+@app.task(name='send_message_about_deleting')
+def send_message_about_deleting(
+        username: str,
+        name_deleted_todo_list: str,
+        telegram: str,
+) -> None:
+    message = MESSAGE_TEMPLATE.format(
+        username=username,
+        todo_list_name=name_deleted_todo_list,
+    )
+    send_text_messages.delay(message, [telegram])
@@ -0,0 +1,165 @@
+import json
+import os
+import socket
+import struct
+import threading
+from contextlib import contextmanager
+from queue import Empty, LifoQueue
+from typing import Any, Iterator
+from uuid import uuid4
+
+from celery_app.settings import (
+    ABSTRACT_TELEGRAM_CONNECT_TIMEOUT,
+    ABSTRACT_TELEGRAM_HOST,
+    ABSTRACT_TELEGRAM_PIPELINE_SIZE,
+    ABSTRACT_TELEGRAM_POOL_SIZE,
+    ABSTRACT_TELEGRAM_PORT,
+    ABSTRACT_TELEGRAM_READ_TIMEOUT,
+)
+from celery_app.utils import chunked
+
+# Every frame is a JSON document prefixed by its length as 4-byte unsigned
+# big-endian integer
+FRAME_HEADER = struct.Struct('!I')
+
+
+def encode_frame(payload: Any) -> bytes:
+    body = json.dumps(payload).encode('utf8')
+    return FRAME_HEADER.pack(len(body)) + body
+
+
+class TelegramConnection:
+
+    def __init__(
+            self,
+            host: str,
+            port: int,
+            connect_timeout: float,
+            read_timeout: float,
+    ) -> None:
+        self.socket = socket.create_connection(
+            (host, port),
+            timeout=connect_timeout,
+        )
+        self.socket.settimeout(read_timeout)
+        self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def send(self, payloads: list[Any]) -> None:
+        self.socket.sendall(
+            b''.join(encode_frame(payload) for payload in payloads),
+        )
+
+    def receive(self) -> Any:
+        header = self._receive_exactly(FRAME_HEADER.size)
+        (size,) = FRAME_HEADER.unpack(header)
+        return json.loads(self._receive_exactly(size).decode('utf8'))
+
+    def close(self) -> None:
+        self.socket.close()
+
+    def _receive_exactly(self, size: int) -> bytes:
+        data = bytearray()
+        while len(data) < size:
+            chunk = self.socket.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError('Telegram closed connection')
+            data.extend(chunk)
+        return bytes(data)
+
+
+class TelegramConnectionPool:
+
+    def __init__(
+            self,
+            host: str,
+            port: int,
+            size: int,
+            connect_timeout: float,
+            read_timeout: float,
+            pipeline_size: int,
+    ) -> None:
+        self.host = host
+        self.port = port
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.pipeline_size = pipeline_size
+        self._idle: LifoQueue[TelegramConnection] = LifoQueue(maxsize=size)
+
+    @contextmanager
+    def connection(self) -> Iterator[TelegramConnection]:
+        try:
+            conn = self._idle.get_nowait()
+        except Empty:
+            conn = TelegramConnection(
+                self.host,
+                self.port,
+                self.connect_timeout,
+                self.read_timeout,
+            )
+        try:
+            yield conn
+        except BaseException:
+            # Connection state is unknown (for example, responses left
+            # unread after timeout), so it can't be reused
+            conn.close()
+            raise
+        if self._idle.full():
+            conn.close()
+        else:
+            self._idle.put_nowait(conn)
+
+    def send_messages(self, messages: list[tuple[str, str]]) -> list[str]:
+        statuses: list[str] = []
+        with self.connection() as conn:
+            for window in chunked(messages, self.pipeline_size):
+                payloads = [
+                    {'id': uuid4().hex, 'telegram': telegram, 'message': text}
+                    for telegram, text in window
+                ]
+                conn.send(payloads)
+                responses: dict[str, str] = {}
+                while len(responses) < len(payloads):
+                    response = conn.receive()
+                    responses[response['id']] = response['status']
+                statuses.extend(
+                    responses[payload['id']] for payload in payloads
+                )
+        return statuses
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except Empty:
+                break
+
+
+def create_pool() -> TelegramConnectionPool:
+    return TelegramConnectionPool(
+        ABSTRACT_TELEGRAM_HOST,
+        ABSTRACT_TELEGRAM_PORT,
+        ABSTRACT_TELEGRAM_POOL_SIZE,
+        ABSTRACT_TELEGRAM_CONNECT_TIMEOUT,
+        ABSTRACT_TELEGRAM_READ_TIMEOUT,
+        ABSTRACT_TELEGRAM_PIPELINE_SIZE,
+    )
+
+
+_pool: TelegramConnectionPool | None = None
+_pool_pid: int | None = None
+_pool_lock = threading.Lock()
+
+
+def get_telegram_pool() -> TelegramConnectionPool:
+    # Sockets must not be shared between prefork worker processes, so every
+    # process lazily opens its own pool. Threads of threads pool share it,
+    # so only the first of them creates it
+    global _pool, _pool_pid
+    pool = _pool
+    if pool is not None and _pool_pid == os.getpid():
+        return pool
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = create_pool()
+            _pool_pid = os.getpid()
+        return _pool
@@ -0,0 +1,86 @@
+import json
+import socket
+import threading
+from typing import Generator
+
+from celery_app.database import mongo_client
+from celery_app.telegram import FRAME_HEADER, TelegramConnectionPool
+from celery_app.tests.fakes import FakeRedis
+from odmantic import SyncEngine
+from pytest import fixture
+from pytest_mock import MockerFixture
+
+# Separate from database of API tests, which is kept for the whole session
+TEST_DATABASE = 'pytest_celery'
+
+
+def receive_frame(conn: socket.socket) -> dict | None:
+    header = conn.recv(FRAME_HEADER.size, socket.MSG_WAITALL)
+    if not header:
+        return None
+    (size,) = FRAME_HEADER.unpack(header)
+    return json.loads(conn.recv(size, socket.MSG_WAITALL).decode('utf8'))
+
+
+def serve_reversed(server: socket.socket, window: int) -> None:
+    # Answers every window of pipelined messages in reverse order to make
+    # sure responses are matched by id, not by position
+    conn, _ = server.accept()
+    with conn:
+        while True:
+            messages = []
+            for _ in range(window):
+                message = receive_frame(conn)
+                if message is None:
+                    return
+                messages.append(message)
+            for message in reversed(messages):
+                if message['telegram'] == '@bad':
+                    status = 'rejected'
+                else:
+                    status = 'accepted'
+                body = json.dumps(
+                    {'id': message['id'], 'status': status},
+                ).encode('utf8')
+                conn.sendall(FRAME_HEADER.pack(len(body)) + body)
+
+
+@fixture
+def telegram_pool() -> Generator[TelegramConnectionPool, None, None]:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server:
+        server.bind(('127.0.0.1', 0))
+        server.listen()
+        host, port = server.getsockname()
+        thread = threading.Thread(
+            target=serve_reversed,
+            args=(server, 2),
+            daemon=True,
+        )
+        thread.start()
+        pool = TelegramConnectionPool(
+            host,
+            port,
+            size=1,
+            connect_timeout=1,
+            read_timeout=1,
+            pipeline_size=2,
+        )
+        yield pool
+        pool.close()
+        thread.join(1)
+
+
+@fixture
+def fake_redis() -> FakeRedis:
+    return FakeRedis()
+
+
+@fixture
+def mongo_test_engine(
+        mocker: MockerFixture,
+) -> Generator[SyncEngine, None, None]:
+    engine = SyncEngine(client=mongo_client, database=TEST_DATABASE)
+    mocker.patch('celery_app.tasks.mongo_engine', engine)
+    mocker.patch('celery_app.outbox.mongo_engine', engine)
+    yield engine
+    mongo_client.drop_database(TEST_DATABASE)
@@ -0,0 +1,93 @@
+from typing import Any
+
+
+class FakeRedis:
+    # Commands used by circuit breaker with expiration by manual clock
+
+    def __init__(self) -> None:
+        self.now = 0.0
+        self.values: dict[str, int] = {}
+        self.expires_at: dict[str, float] = {}
+
+    def expire_keys(self) -> None:
+        for key, expires_at in list(self.expires_at.items()):
+            if expires_at <= self.now:
+                self.values.pop(key, None)
+                del self.expires_at[key]
+
+    def set(  # noqa: A003 (the same name as in Redis)
+            self,
+            key: str,
+            value: int,
+            nx: bool = False,
+            ex: int | None = None,
+    ) -> bool:
+        self.expire_keys()
+        if nx and key in self.values:
+            return False
+        self.values[key] = value
+        self.expires_at.pop(key, None)
+        if ex is not None:
+            self.expires_at[key] = self.now + ex
+        return True
+
+    def delete(self, *keys: str) -> int:
+        self.expire_keys()
+        deleted = 0
+        for key in keys:
+            deleted += self.values.pop(key, None) is not None
+            self.expires_at.pop(key, None)
+        return deleted
+
+    def exists(self, key: str) -> int:
+        self.expire_keys()
+        return int(key in self.values)
+
+    def incr(self, key: str) -> int:
+        self.expire_keys()
+        self.values[key] = self.values.get(key, 0) + 1
+        return self.values[key]
+
+    def expire(self, key: str, seconds: int) -> bool:
+        self.expire_keys()
+        if key not in self.values:
+            return False
+        self.expires_at[key] = self.now + seconds
+        return True
+
+    def pttl(self, key: str) -> int:
+        self.expire_keys()
+        if key not in self.values:
+            return -2
+        if key not in self.expires_at:
+            return -1
+        return int((self.expires_at[key] - self.now) * 1000)
+
+    def pipeline(self, transaction: bool = True) -> 'FakePipeline':
+        return FakePipeline(self)
+
+
+class FakePipeline:
+
+    def __init__(self, redis: FakeRedis) -> None:
+        self.redis = redis
+        self.commands: list[tuple[str, tuple, dict]] = []
+
+    def __enter__(self) -> 'FakePipeline':
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.commands.clear()
+
+    def __getattr__(self, name: str) -> Any:
+        def queue(*args: Any, **kwargs: Any) -> None:
+            self.commands.append((name, args, kwargs))
+        return queue
+
+    def execute(self) -> list:
+        results = [
+            getattr(self.redis, name)(*args, **kwargs)
+            for name, args, kwargs in self.commands
+        ]
+        self.commands.clear()
+        return results
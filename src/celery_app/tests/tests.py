@@ -0,0 +1,623 @@
+import datetime
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable
+from unittest.mock import MagicMock
+
+from celery import Signature
+from celery.exceptions import Retry
+from celery.signals import task_postrun, task_prerun
+from celery_app.circuit import CircuitBreaker
+from celery_app.database import configure_database
+from celery_app.digest import format_digest, group_by_digest
+from celery_app.outbox import move_todo_list_messages, relay_batch
+from celery_app.ratelimit import GLOBAL_BUCKET_KEY, TokenBucketLimiter
+from celery_app.settings import (
+    CASCADE_DELETE_COUNTDOWN,
+    MESSAGE_TEMPLATE,
+    TELEGRAM_RETRY_BACKOFF,
+    TELEGRAM_RETRY_BACKOFF_MAX,
+)
+from celery_app.tasks import (
+    delete_todo_list_tasks,
+    notify_about_deleting,
+    repair_task_counters,
+    send_text_messages,
+    telegram_breaker,
+    telegram_limiter,
+)
+from celery_app.telegram import TelegramConnectionPool, get_telegram_pool
+from celery_app.tests.fakes import FakeRedis
+from odmantic import ObjectId, SyncEngine
+from prometheus_client import REGISTRY
+from pytest_mock import MockerFixture
+from settings import OUTBOX_RETENTION
+
+from todo_list.models import (
+    OutboxMessage,
+    RECIPIENTS_INDEX,
+    TODOList,
+    Task,
+    User,
+    configure_models,
+)
+from todo_list.response_cache import (
+    GENERATION_KEY,
+    SUPERUSER_SCOPE,
+    user_scope,
+)
+
+
+def test_pipelined_responses_matched_by_id(
+        telegram_pool: TelegramConnectionPool,
+) -> None:
+    messages = [
+        ('@first', 'x' * 4096),
+        ('@bad', 'second'),
+        ('@third', 'third'),
+        ('@fourth', 'fourth'),
+    ]
+    statuses = telegram_pool.send_messages(messages)
+    assert statuses == ['accepted', 'rejected', 'accepted', 'accepted']
+
+
+def test_connection_reused(telegram_pool: TelegramConnectionPool) -> None:
+    telegram_pool.send_messages([('@first', 'first'), ('@second', 'second')])
+    with telegram_pool.connection() as conn:
+        reused_conn = conn
+    telegram_pool.send_messages([('@first', 'first'), ('@second', 'second')])
+    with telegram_pool.connection() as conn:
+        assert conn is reused_conn
+
+
+def test_digest_excludes_own_deletions() -> None:
+    deletions = [
+        {'owner_id': '1', 'username': 'first', 'name': 'foo'},
+        {'owner_id': '2', 'username': 'second', 'name': 'bar'},
+    ]
+    recipients = [
+        {'_id': '1', 'telegram': '@first'},
+        {'_id': '2', 'telegram': '@second'},
+        {'_id': '3', 'telegram': '@third'},
+        {'_id': '4', 'telegram': '@fourth'},
+    ]
+    assert group_by_digest(deletions, recipients) == {
+        format_digest(deletions): ['@third', '@fourth'],
+        format_digest(deletions[1:]): ['@first'],
+        format_digest(deletions[:1]): ['@second'],
+    }
+    assert 'foo' in format_digest(deletions)
+    assert 'bar' in format_digest(deletions)
+
+
+def test_task_runtime_observed_by_signals() -> None:
+    labels = {'task': delete_todo_list_tasks.name, 'state': 'SUCCESS'}
+    observed = REGISTRY.get_sample_value('celery_task_seconds_count', labels)
+    task_prerun.send(
+        sender=delete_todo_list_tasks,
+        task_id='task-id',
+        task=delete_todo_list_tasks,
+    )
+    task_postrun.send(
+        sender=delete_todo_list_tasks,
+        task_id='task-id',
+        task=delete_todo_list_tasks,
+        state='SUCCESS',
+    )
+    assert REGISTRY.get_sample_value(
+        'celery_task_seconds_count',
+        labels,
+    ) == (observed or 0) + 1
+
+
+def create_limiter(
+        take_tokens: MagicMock,
+        rate: float,
+        destination_rate: float,
+) -> tuple[TokenBucketLimiter, MagicMock]:
+    redis = MagicMock()
+    redis.register_script.return_value = take_tokens
+    pipeline = redis.pipeline.return_value.__enter__.return_value
+    limiter = TokenBucketLimiter(
+        redis,
+        rate=rate,
+        burst=10,
+        destination_rate=destination_rate,
+        destination_burst=1,
+    )
+    return limiter, pipeline
+
+
+def test_limiter_defers_destinations_over_global_limit() -> None:
+    take_tokens = MagicMock(return_value=[2, '0.5'])
+    limiter, _ = create_limiter(take_tokens, rate=100, destination_rate=0)
+    assert limiter.acquire(['@first', '@second', '@third']) == (
+        ['@first', '@second'],
+        ['@third'],
+        0.5,
+    )
+    take_tokens.assert_called_once_with(
+        keys=[GLOBAL_BUCKET_KEY],
+        args=[100, 10, 3],
+    )
+
+
+def test_limiter_defers_destinations_over_own_limit() -> None:
+    take_tokens = MagicMock()
+    limiter, pipeline = create_limiter(
+        take_tokens,
+        rate=0,
+        destination_rate=1,
+    )
+    pipeline.execute.return_value = [[1, '0'], [0, '1.5'], [0, '0.5']]
+    # The same destination twice gets its own token for every message
+    assert limiter.acquire(['@first', '@second', '@first']) == (
+        ['@first'],
+        ['@second', '@first'],
+        1.5,
+    )
+    assert take_tokens.call_count == 3
+    assert all(
+        call.kwargs['client'] is pipeline
+        for call in take_tokens.call_args_list
+    )
+
+
+def test_limiter_keeps_globally_deferred_destinations() -> None:
+    take_tokens = MagicMock(return_value=[1, '2'])
+    limiter, pipeline = create_limiter(
+        take_tokens,
+        rate=100,
+        destination_rate=1,
+    )
+    pipeline.execute.return_value = [[0, '1']]
+    assert limiter.acquire(['@first', '@second']) == (
+        [],
+        ['@second', '@first'],
+        2,
+    )
+
+
+def test_deferred_recipients_sent_by_another_task(
+        mocker: MockerFixture,
+) -> None:
+    mocker.patch.object(telegram_breaker, 'retry_after', return_value=0)
+    mocker.patch.object(telegram_breaker, 'record_success')
+    mocker.patch.object(
+        telegram_limiter,
+        'acquire',
+        return_value=(['@first'], ['@second', '@third'], 2.5),
+    )
+    pool = mocker.patch('celery_app.tasks.get_telegram_pool').return_value
+    pool.send_messages.return_value = ['accepted']
+    apply_async = mocker.patch.object(send_text_messages, 'apply_async')
+    started_at = time.monotonic()
+    send_text_messages.apply(
+        args=('text', ['@first', '@second', '@third']),
+    ).get()
+    # Task doesn't wait for tokens of deferred recipients
+    assert time.monotonic() - started_at < 2.5
+    apply_async.assert_called_once_with(
+        ('text', ['@second', '@third']),
+        countdown=2.5,
+    )
+    pool.send_messages.assert_called_once_with([('@first', 'text')])
+
+
+def create_breaker(fake_redis: FakeRedis) -> CircuitBreaker:
+    return CircuitBreaker(
+        fake_redis,  # type: ignore[arg-type]
+        'test',
+        failure_threshold=3,
+        failure_window=60,
+        open_seconds=30,
+    )
+
+
+def test_circuit_opens_at_failure_threshold(fake_redis: FakeRedis) -> None:
+    breaker = create_breaker(fake_redis)
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.retry_after() == 0
+    breaker.record_failure()
+    assert breaker.retry_after() == 30
+    fake_redis.now = 10
+    assert breaker.retry_after() == 20
+
+
+def test_circuit_failures_expire_after_window(fake_redis: FakeRedis) -> None:
+    breaker = create_breaker(fake_redis)
+    breaker.record_failure()
+    breaker.record_failure()
+    fake_redis.now = 61
+    breaker.record_failure()
+    assert breaker.retry_after() == 0
+
+
+def test_circuit_allows_single_probe(fake_redis: FakeRedis) -> None:
+    breaker = create_breaker(fake_redis)
+    for _ in range(3):
+        breaker.record_failure()
+    fake_redis.now = 30
+    assert breaker.retry_after() == 0
+    # Other callers wait while the probe is running
+    assert breaker.retry_after() == 30
+    breaker.record_success()
+    assert breaker.retry_after() == 0
+    assert breaker.retry_after() == 0
+
+
+def test_circuit_reopens_on_failed_probe(fake_redis: FakeRedis) -> None:
+    breaker = create_breaker(fake_redis)
+    for _ in range(3):
+        breaker.record_failure()
+    fake_redis.now = 30
+    assert breaker.retry_after() == 0
+    # A single failure is enough while circuit is tripped
+    breaker.record_failure()
+    assert breaker.retry_after() == 30
+    fake_redis.now = 60
+    assert breaker.retry_after() == 0
+
+
+def test_send_retries_allowed_recipients_on_connection_error(
+        mocker: MockerFixture,
+) -> None:
+    mocker.patch.object(telegram_breaker, 'retry_after', return_value=0)
+    record_failure = mocker.patch.object(telegram_breaker, 'record_failure')
+    mocker.patch.object(
+        telegram_limiter,
+        'acquire',
+        return_value=(['@first'], ['@second'], 1),
+    )
+    pool = mocker.patch('celery_app.tasks.get_telegram_pool').return_value
+    error = ConnectionResetError()
+    pool.send_messages.side_effect = error
+    backoff = mocker.patch(
+        'celery_app.tasks.get_exponential_backoff_interval',
+        return_value=7,
+    )
+    mocker.patch.object(send_text_messages, 'apply_async')
+    retry = mocker.patch.object(
+        send_text_messages,
+        'retry',
+        return_value=Retry(),
+    )
+    send_text_messages.apply(args=('text', ['@first', '@second']), retries=2)
+    record_failure.assert_called_once_with()
+    backoff.assert_called_once_with(
+        TELEGRAM_RETRY_BACKOFF,
+        2,
+        TELEGRAM_RETRY_BACKOFF_MAX,
+        full_jitter=True,
+    )
+    retry.assert_called_once_with(
+        args=('text', ['@first']),
+        exc=error,
+        countdown=7,
+    )
+
+
+def test_send_requeued_while_circuit_is_open(mocker: MockerFixture) -> None:
+    mocker.patch.object(telegram_breaker, 'retry_after', return_value=12.5)
+    acquire = mocker.patch.object(telegram_limiter, 'acquire')
+    apply_async = mocker.patch.object(send_text_messages, 'apply_async')
+    send_text_messages.apply(args=('text', ['@first']), retries=3).get()
+    apply_async.assert_called_once_with(
+        ('text', ['@first']),
+        countdown=12.5,
+        retries=3,
+    )
+    acquire.assert_not_called()
+
+
+def test_notification_about_deleting_sent_by_chunks(
+        mocker: MockerFixture,
+        mongo_test_engine: SyncEngine,
+) -> None:
+    mocker.patch('celery_app.tasks.NOTIFICATION_DIGEST_WINDOW', 0)
+    mocker.patch('celery_app.tasks.NOTIFICATION_BATCH_SIZE', 3)
+    mocker.patch('celery_app.tasks.NOTIFICATION_CHUNK_SIZE', 2)
+    groups: list[list[tuple]] = []
+
+    def create_group(signatures: Iterable[Signature]) -> MagicMock:
+        groups.append([signature.args for signature in signatures])
+        return MagicMock()
+
+    group = mocker.patch('celery_app.tasks.group', side_effect=create_group)
+    configure_models(mongo_test_engine)
+    users = mongo_test_engine.get_collection(User)
+    owner, *others = [
+        User(
+            username=f'user{number}',
+            password='password',
+            telegram=f'@user{number}',
+            last_seen=datetime.datetime.utcnow(),
+            is_superuser=number == 1,
+        )
+        for number in range(7)
+    ]
+    users.insert_many([user.doc() for user in [owner, *others]])
+    collection = MagicMock(wraps=users)
+    mocker.patch.object(
+        mongo_test_engine,
+        'get_collection',
+        return_value=collection,
+    )
+    notify_about_deleting.apply(args=(str(owner.id), 'deleted')).get()
+    message = MESSAGE_TEMPLATE.format(
+        username=owner.username,
+        todo_list_name='deleted',
+    )
+    assert group.call_count == 2
+    assert [[len(args[1]) for args in chunks] for chunks in groups] == [
+        [2, 1],
+        [2, 1],
+    ]
+    assert {args[0] for chunks in groups for args in chunks} == {message}
+    # Superuser who deleted the list is notified too, owner is not
+    assert sorted(
+        telegram
+        for chunks in groups
+        for args in chunks
+        for telegram in args[1]
+    ) == sorted(user.telegram for user in others)
+    # Recipients are read from covering index only
+    query, projection = collection.find.call_args.args
+    kwargs = collection.find.call_args.kwargs
+    assert kwargs['hint'] == RECIPIENTS_INDEX
+    explain = users.find(query, projection, **kwargs).explain()
+    assert explain['executionStats']['totalDocsExamined'] == 0
+
+
+def test_tasks_of_deleted_todo_list_removed_by_batches(
+        mocker: MockerFixture,
+        mongo_test_engine: SyncEngine,
+) -> None:
+    mocker.patch('celery_app.tasks.CASCADE_DELETE_BATCH_SIZE', 2)
+    apply_async = mocker.patch.object(delete_todo_list_tasks, 'apply_async')
+    todo_lists = mongo_test_engine.get_collection(TODOList)
+    tasks = mongo_test_engine.get_collection(Task)
+    deleted_id, kept_id = ObjectId(), ObjectId()
+    todo_lists.insert_many(
+        [
+            {'_id': deleted_id, 'name': 'deleted', 'is_deleted': True},
+            {'_id': kept_id, 'name': 'kept', 'is_deleted': False},
+        ],
+    )
+    tasks.insert_many(
+        [
+            {'name': f'task{number}', 'todo_list': todo_list_id}
+            for todo_list_id in [deleted_id, kept_id]
+            for number in range(3)
+        ],
+    )
+    delete_todo_list_tasks.apply(args=(str(deleted_id),)).get()
+    apply_async.assert_called_once_with(
+        (str(deleted_id),),
+        countdown=CASCADE_DELETE_COUNTDOWN,
+    )
+    assert tasks.count_documents({'todo_list': deleted_id}) == 1
+    assert todo_lists.count_documents({'_id': deleted_id}) == 1
+    delete_todo_list_tasks.apply(args=(str(deleted_id),)).get()
+    assert apply_async.call_count == 1
+    assert tasks.count_documents({'todo_list': deleted_id}) == 0
+    assert todo_lists.count_documents({'_id': deleted_id}) == 0
+    assert tasks.count_documents({'todo_list': kept_id}) == 3
+    assert todo_lists.count_documents({'_id': kept_id}) == 1
+
+
+def test_tasks_removed_only_of_deleted_todo_list(
+        mocker: MockerFixture,
+        mongo_test_engine: SyncEngine,
+) -> None:
+    # List and its tasks are removed only when it has been marked deleted
+    apply_async = mocker.patch.object(delete_todo_list_tasks, 'apply_async')
+    mocker.patch('celery_app.tasks.CASCADE_DELETE_BATCH_SIZE', 2)
+    todo_lists = mongo_test_engine.get_collection(TODOList)
+    tasks = mongo_test_engine.get_collection(Task)
+    todo_list_id = ObjectId()
+    todo_lists.insert_one(
+        {'_id': todo_list_id, 'name': 'live', 'is_deleted': False},
+    )
+    tasks.insert_many(
+        [
+            {'name': f'task{number}', 'todo_list': todo_list_id}
+            for number in range(3)
+        ],
+    )
+    delete_todo_list_tasks.apply(args=(str(todo_list_id),)).get()
+    apply_async.assert_not_called()
+    assert tasks.count_documents({'todo_list': todo_list_id}) == 3
+    assert todo_lists.count_documents({'_id': todo_list_id}) == 1
+
+
+def test_repair_task_counters_updates_drifted_lists(
+        mocker: MockerFixture,
+        mongo_test_engine: SyncEngine,
+) -> None:
+    mocker.patch('celery_app.tasks.RESPONSE_CACHE_BACKEND', 'redis')
+    cache_redis_client = mocker.patch('celery_app.tasks.cache_redis_client')
+    pipeline = cache_redis_client.pipeline.return_value.__enter__.return_value
+    todo_lists = mongo_test_engine.get_collection(TODOList)
+    tasks = mongo_test_engine.get_collection(Task)
+    counters = {
+        'correct': (2, 1),
+        'drifted': (5, 0),
+        'emptied': (3, 2),
+        'empty': (0, 0),
+    }
+    ids = {name: ObjectId() for name in counters}
+    owners = {name: ObjectId() for name in counters}
+    todo_lists.insert_many(
+        [
+            {
+                '_id': ids[name],
+                'name': name,
+                'task_count': task_count,
+                'completed_count': completed_count,
+                'revision': 0,
+                'user': owners[name],
+            }
+            for name, (task_count, completed_count) in counters.items()
+        ],
+    )
+    tasks.insert_many(
+        [
+            {'name': name, 'is_complete': is_complete, 'todo_list': ids[key]}
+            for key, name, is_complete in [
+                ('correct', 'first', True),
+                ('correct', 'second', False),
+                ('drifted', 'first', True),
+            ]
+        ],
+    )
+    repair_task_counters.apply().get()
+    repaired = {
+        todo_list['name']: (
+            todo_list['task_count'],
+            todo_list['completed_count'],
+            todo_list['revision'],
+        )
+        for todo_list in todo_lists.find()
+    }
+    assert repaired == {
+        'correct': (2, 1, 0),
+        'drifted': (1, 1, 1),
+        'emptied': (0, 0, 1),
+        'empty': (0, 0, 0),
+    }
+    bumped = [call.args[0] for call in pipeline.incr.call_args_list]
+    assert sorted(bumped) == sorted(
+        [
+            GENERATION_KEY.format(scope=user_scope(owners['drifted'])),
+            GENERATION_KEY.format(scope=SUPERUSER_SCOPE),
+            GENERATION_KEY.format(scope=user_scope(owners['emptied'])),
+            GENERATION_KEY.format(scope=SUPERUSER_SCOPE),
+        ],
+    )
+
+
+def test_relay_marks_messages_after_publishing(
+        mocker: MockerFixture,
+        mongo_test_engine: SyncEngine,
+) -> None:
+    mocker.patch('celery_app.outbox.OUTBOX_BATCH_SIZE', 2)
+    outbox = mongo_test_engine.get_collection(OutboxMessage)
+
+    def check_not_marked(messages: list[tuple[str, list]]) -> None:
+        published = outbox.count_documents({'published_at': {'$ne': None}})
+        assert published == 1
+
+    publish_tasks = mocker.patch(
+        'celery_app.outbox.publish_tasks',
+        side_effect=check_not_marked,
+    )
+    outbox.insert_many(
+        [
+            message.doc()
+            for message in [
+                OutboxMessage(
+                    task='published',
+                    args=[],
+                    published_at=datetime.datetime.utcnow(),
+                ),
+                OutboxMessage(task='first', args=['1']),
+                OutboxMessage(task='second', args=['2']),
+                OutboxMessage(task='third', args=['3']),
+            ]
+        ],
+    )
+    assert relay_batch() == 2
+    publish_tasks.assert_called_once_with(
+        [('first', ['1']), ('second', ['2'])],
+    )
+    publish_tasks.side_effect = None
+    assert relay_batch() == 1
+    publish_tasks.assert_called_with([('third', ['3'])])
+    assert relay_batch() == 0
+    assert publish_tasks.call_count == 2
+    assert outbox.count_documents({'published_at': None}) == 0
+
+
+def test_relay_moves_messages_of_deleted_todo_lists(
+        mongo_test_engine: SyncEngine,
+) -> None:
+    todo_lists = mongo_test_engine.get_collection(TODOList)
+    outbox = mongo_test_engine.get_collection(OutboxMessage)
+    moved = OutboxMessage(task='notify_about_deleting', args=['1', 'name'])
+    message = OutboxMessage(task='delete_todo_list_tasks', args=['1'])
+    # Message was already moved before a crash, list still keeps it
+    outbox.insert_one(moved.doc())
+    todo_lists.insert_many(
+        [
+            {
+                'name': 'deleted',
+                'is_deleted': True,
+                'outbox': [message.doc(), moved.doc()],
+            },
+            {'name': 'live', 'is_deleted': False},
+        ],
+    )
+    assert move_todo_list_messages() == 2
+    assert move_todo_list_messages() == 0
+    assert todo_lists.count_documents({'outbox': {'$exists': True}}) == 0
+    assert [
+        (document['task'], document['args'])
+        for document in outbox.find(sort=[('_id', 1)])
+    ] == [
+        ('notify_about_deleting', ['1', 'name']),
+        ('delete_todo_list_tasks', ['1']),
+    ]
+
+
+def test_telegram_pool_created_once_by_concurrent_threads(
+        mocker: MockerFixture,
+) -> None:
+    mocker.patch('celery_app.telegram._pool', None)
+
+    def create_pool() -> MagicMock:
+        time.sleep(0.05)
+        return MagicMock()
+
+    create = mocker.patch(
+        'celery_app.telegram.create_pool',
+        side_effect=create_pool,
+    )
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        pools = list(
+            executor.map(lambda _: get_telegram_pool(), range(8)),
+        )
+    assert create.call_count == 1
+    assert all(pool is pools[0] for pool in pools)
+
+
+def test_worker_creates_indexes_of_models(
+        mocker: MockerFixture,
+        mongo_test_engine: SyncEngine,
+) -> None:
+    mocker.patch(
+        'celery_app.database.DATABASE',
+        mongo_test_engine.database_name,
+    )
+    todo_lists = mongo_test_engine.get_collection(TODOList)
+    todo_list_id = todo_lists.insert_one({'name': 'legacy'}).inserted_id
+    outbox = mongo_test_engine.get_collection(OutboxMessage)
+    # Index of previous retention is replaced instead of failing start
+    outbox.create_index(
+        'published_at',
+        expireAfterSeconds=OUTBOX_RETENTION + 1,
+    )
+    configure_database()
+    indexes = mongo_test_engine.get_collection(User).index_information()
+    assert RECIPIENTS_INDEX in indexes
+    # Lists created before is_deleted field keep unique names
+    legacy = todo_lists.find_one({'_id': todo_list_id})
+    assert legacy is not None
+    assert legacy['is_deleted'] is False
+    assert todo_lists.index_information()['name_1_user_1'][
+        'partialFilterExpression'
+    ] == {'is_deleted': False}
+    assert outbox.index_information()['published_at_1'][
+        'expireAfterSeconds'
+    ] == OUTBOX_RETENTION
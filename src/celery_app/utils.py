@@ -1,3 +1,9 @@
+from itertools import islice
+from typing import Iterable, Iterator, TypeVar
+
+T = TypeVar('T')
+
+
 def is_ip_address(ip_address: str) -> bool:
     parts = ip_address.split('.', 3)
     for part in parts:
@@ -9,3 +15,9 @@ def is_ip_address(ip_address: str) -> bool:
             if num > 255:
                 return False
     return True
+
+
+def chunked(iterable: Iterable[T], size: int) -> Iterator[list[T]]:
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
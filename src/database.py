@@ -1,6 +1,10 @@
+from metrics import mongo_event_listeners
 from motor.motor_asyncio import AsyncIOMotorClient
 from odmantic import AIOEngine
 from settings import DATABASE, MONGO_URI
 
-mongo_client = AsyncIOMotorClient(MONGO_URI)
+mongo_client = AsyncIOMotorClient(
+    MONGO_URI,
+    event_listeners=mongo_event_listeners(),
+)
 mongo_engine = AIOEngine(client=mongo_client, database=DATABASE)
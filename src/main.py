@@ -1,15 +1,35 @@
 from fastapi import FastAPI
 from fastapi_health import health
+from metrics import MetricsMiddleware, metrics
+from middlewares import CompressionMiddleware
+from settings import (
+    COMPRESSION_BROTLI_QUALITY,
+    COMPRESSION_GZIP_LEVEL,
+    COMPRESSION_MINIMUM_SIZE,
+)
 from uvicorn import run as uvicorn_run
 
 from todo_list import routers
 from todo_list.handlers import add_exception_handlers
-from todo_list.utils import check_database
+from todo_list.publisher import task_publisher
+from todo_list.utils import check_database, configure_database
 
 app = FastAPI()
 
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=COMPRESSION_MINIMUM_SIZE,
+    gzip_level=COMPRESSION_GZIP_LEVEL,
+    brotli_quality=COMPRESSION_BROTLI_QUALITY,
+)
+# Added last to measure time of the whole request including compression
+app.add_middleware(MetricsMiddleware, routes=app.routes)
+
+app.add_event_handler('startup', configure_database)
+app.add_event_handler('shutdown', task_publisher.shutdown)
 app.include_router(routers.router)
 app.add_api_route('/health', health([check_database]))
+app.add_route('/metrics', metrics, include_in_schema=False)
 add_exception_handlers(app)
 
 if __name__ == '__main__':
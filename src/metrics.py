@@ -0,0 +1,207 @@
+import threading
+import time
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+from pymongo import monitoring
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.routing import BaseRoute, Match
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+HTTP_REQUEST_SECONDS = Histogram(
+    'http_request_seconds',
+    'Time of handling HTTP request',
+    ['method', 'route', 'status'],
+)
+HTTP_REQUESTS_IN_PROGRESS = Gauge(
+    'http_requests_in_progress',
+    'HTTP requests being handled',
+    ['method', 'route'],
+)
+MONGO_COMMAND_SECONDS = Histogram(
+    'mongo_command_seconds',
+    'Time of MongoDB command measured by driver',
+    ['command', 'outcome'],
+)
+MONGO_POOL_CONNECTIONS = Gauge(
+    'mongo_pool_connections',
+    'Open connections of MongoDB connection pool',
+    ['address'],
+)
+MONGO_POOL_CHECKED_OUT = Gauge(
+    'mongo_pool_checked_out_connections',
+    'Connections of MongoDB connection pool being used',
+    ['address'],
+)
+MONGO_POOL_CHECKOUT_SECONDS = Histogram(
+    'mongo_pool_checkout_seconds',
+    'Time of waiting for connection from MongoDB connection pool',
+    ['address'],
+)
+MONGO_POOL_CHECKOUT_FAILURES = Counter(
+    'mongo_pool_checkout_failures',
+    'Failed checkouts of connections from MongoDB connection pool',
+    ['address', 'reason'],
+)
+# Requests which don't match any route are counted together, so scanners
+# can't create a series per path
+UNMATCHED_ROUTE = '<unmatched>'
+
+
+def route_path(routes: list[BaseRoute], scope: Scope) -> str:
+    # Path template of route is used instead of path of request to keep
+    # number of series bounded
+    partial_path = UNMATCHED_ROUTE
+    for route in routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(route, 'path', UNMATCHED_ROUTE)
+        if match == Match.PARTIAL and partial_path == UNMATCHED_ROUTE:
+            partial_path = getattr(route, 'path', UNMATCHED_ROUTE)
+    return partial_path
+
+
+class MetricsMiddleware:
+
+    def __init__(self, app: ASGIApp, routes: list[BaseRoute]) -> None:
+        self.app = app
+        self.routes = routes
+
+    async def __call__(
+            self,
+            scope: Scope,
+            receive: Receive,
+            send: Send,
+    ) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        method = scope['method']
+        route = route_path(self.routes, scope)
+        status = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        in_progress = HTTP_REQUESTS_IN_PROGRESS.labels(method, route)
+        in_progress.inc()
+        started_at = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_REQUEST_SECONDS.labels(method, route, status).observe(
+                time.perf_counter() - started_at,
+            )
+            in_progress.dec()
+
+
+async def metrics(request: Request) -> Response:
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
+def format_address(address: tuple[str, int | None]) -> str:
+    host, port = address
+    return host if port is None else f'{host}:{port}'
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        pass
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        MONGO_COMMAND_SECONDS.labels(event.command_name, 'succeeded').observe(
+            event.duration_micros / 1_000_000,
+        )
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        MONGO_COMMAND_SECONDS.labels(event.command_name, 'failed').observe(
+            event.duration_micros / 1_000_000,
+        )
+
+
+class MongoPoolMetrics(monitoring.ConnectionPoolListener):
+    # Driver checks connections out in the thread which runs the operation
+    # (Motor uses threads of its executor), so start of waiting is kept per
+    # thread
+
+    def __init__(self) -> None:
+        self.checkout_started = threading.local()
+
+    def pool_created(self, event: monitoring.PoolCreatedEvent) -> None:
+        pass
+
+    def pool_ready(self, event: monitoring.PoolReadyEvent) -> None:
+        pass
+
+    def pool_cleared(self, event: monitoring.PoolClearedEvent) -> None:
+        pass
+
+    def pool_closed(self, event: monitoring.PoolClosedEvent) -> None:
+        pass
+
+    def connection_created(
+            self,
+            event: monitoring.ConnectionCreatedEvent,
+    ) -> None:
+        MONGO_POOL_CONNECTIONS.labels(format_address(event.address)).inc()
+
+    def connection_ready(self, event: monitoring.ConnectionReadyEvent) -> None:
+        pass
+
+    def connection_closed(
+            self,
+            event: monitoring.ConnectionClosedEvent,
+    ) -> None:
+        MONGO_POOL_CONNECTIONS.labels(format_address(event.address)).dec()
+
+    def connection_check_out_started(
+            self,
+            event: monitoring.ConnectionCheckOutStartedEvent,
+    ) -> None:
+        self.checkout_started.value = time.perf_counter()
+
+    def connection_check_out_failed(
+            self,
+            event: monitoring.ConnectionCheckOutFailedEvent,
+    ) -> None:
+        address = format_address(event.address)
+        self.observe_checkout(address)
+        MONGO_POOL_CHECKOUT_FAILURES.labels(address, event.reason).inc()
+
+    def connection_checked_out(
+            self,
+            event: monitoring.ConnectionCheckedOutEvent,
+    ) -> None:
+        address = format_address(event.address)
+        self.observe_checkout(address)
+        MONGO_POOL_CHECKED_OUT.labels(address).inc()
+
+    def connection_checked_in(
+            self,
+            event: monitoring.ConnectionCheckedInEvent,
+    ) -> None:
+        MONGO_POOL_CHECKED_OUT.labels(format_address(event.address)).dec()
+
+    def observe_checkout(self, address: str) -> None:
+        started_at = getattr(self.checkout_started, 'value', None)
+        if started_at is None:
+            return
+        self.checkout_started.value = None
+        MONGO_POOL_CHECKOUT_SECONDS.labels(address).observe(
+            time.perf_counter() - started_at,
+        )
+
+
+def mongo_event_listeners() -> list:
+    # Listeners can be given only on creation of client
+    return [MongoCommandMetrics(), MongoPoolMetrics()]
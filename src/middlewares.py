@@ -0,0 +1,221 @@
+import time
+import zlib
+
+import brotli
+from prometheus_client import Counter, Histogram
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+COMPRESSION_RATIO = Histogram(
+    'response_compression_ratio',
+    'Size of response body divided by size of compressed one',
+    ['encoding'],
+    buckets=(1, 1.5, 2, 3, 5, 8, 13, 21, 34),
+)
+COMPRESSION_CPU_SECONDS = Counter(
+    'response_compression_cpu_seconds',
+    'CPU time spent on compressing responses',
+    ['encoding'],
+)
+# Preferred encodings go first
+ENCODINGS = ['br', 'gzip']
+NOT_COMPRESSED_STATUSES = {204, 304}
+
+
+def choose_encoding(accept_encoding: str) -> str | None:
+    qualities = {}
+    for item in accept_encoding.split(','):
+        coding, *params = item.split(';')
+        quality = 1.0
+        for param in params:
+            name, _, value = param.strip().partition('=')
+            if name.lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0
+        # Coding with q=0 is refused even if wildcard accepts others
+        qualities[coding.strip().lower()] = quality
+    wildcard = qualities.get('*', 0)
+    best, best_quality = None, 0.0
+    # Server preference breaks ties of equal qualities
+    for encoding in ENCODINGS:
+        quality = qualities.get(encoding, wildcard)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+class Compressor:
+    # Every chunk is flushed, so streamed lines reach client as soon as
+    # they are sent by application
+
+    def __init__(
+            self,
+            encoding: str,
+            gzip_level: int,
+            brotli_quality: int,
+    ) -> None:
+        self.encoding = encoding
+        self.cpu_seconds = 0.0
+        self.raw_size = 0
+        self.compressed_size = 0
+        if encoding == 'br':
+            self.brotli = brotli.Compressor(quality=brotli_quality)
+        else:
+            self.gzip = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes, finish: bool) -> bytes:
+        started_at = time.thread_time()
+        if self.encoding == 'br':
+            compressed = self.brotli.process(data)
+            if finish:
+                compressed += self.brotli.finish()
+            else:
+                compressed += self.brotli.flush()
+        else:
+            compressed = self.gzip.compress(data)
+            compressed += self.gzip.flush(
+                zlib.Z_FINISH if finish else zlib.Z_SYNC_FLUSH,
+            )
+        self.cpu_seconds += time.thread_time() - started_at
+        self.raw_size += len(data)
+        self.compressed_size += len(compressed)
+        if finish:
+            self.observe()
+        return compressed
+
+    def observe(self) -> None:
+        COMPRESSION_CPU_SECONDS.labels(self.encoding).inc(self.cpu_seconds)
+        if self.compressed_size:
+            COMPRESSION_RATIO.labels(self.encoding).observe(
+                self.raw_size / self.compressed_size,
+            )
+
+
+class CompressionMiddleware:
+
+    def __init__(
+            self,
+            app: ASGIApp,
+            minimum_size: int,
+            gzip_level: int,
+            brotli_quality: int,
+    ) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(
+            self,
+            scope: Scope,
+            receive: Receive,
+            send: Send,
+    ) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(
+            Headers(scope=scope).get('accept-encoding', ''),
+        )
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        responder = CompressionResponder(
+            send,
+            Compressor(encoding, self.gzip_level, self.brotli_quality),
+            self.minimum_size,
+        )
+        await self.app(scope, receive, responder.send)
+
+
+class CompressionResponder:
+    # Start of response is held until the first chunk of body, which tells
+    # whether the whole body is small or it is streamed
+
+    def __init__(
+            self,
+            send: Send,
+            compressor: Compressor,
+            minimum_size: int,
+    ) -> None:
+        self.original_send = send
+        self.compressor = compressor
+        self.minimum_size = minimum_size
+        self.start_message: Message | None = None
+        self.compressing = False
+
+    async def send(self, message: Message) -> None:
+        if message['type'] == 'http.response.start':
+            self.start_message = message
+            return
+        if message['type'] != 'http.response.body':
+            await self.original_send(message)
+            return
+        if self.start_message is not None:
+            await self.start(message)
+            return
+        if not self.compressing:
+            await self.original_send(message)
+            return
+        more_body = message.get('more_body', False)
+        await self.original_send(
+            {
+                'type': 'http.response.body',
+                'body': self.compressor.compress(
+                    message.get('body', b''),
+                    finish=not more_body,
+                ),
+                'more_body': more_body,
+            },
+        )
+
+    def should_compress(
+            self,
+            status: int,
+            headers: MutableHeaders,
+            body: bytes | None,
+    ) -> bool:
+        # Body is None when response is streamed, its size is unknown then
+        if status in NOT_COMPRESSED_STATUSES:
+            return False
+        if 'content-encoding' in headers:
+            return False
+        return body is None or len(body) >= self.minimum_size
+
+    async def start(self, message: Message) -> None:
+        assert self.start_message is not None
+        start_message, self.start_message = self.start_message, None
+        headers = MutableHeaders(raw=start_message['headers'])
+        body = message.get('body', b'')
+        more_body = message.get('more_body', False)
+        if not self.should_compress(
+                start_message['status'],
+                headers,
+                None if more_body else body,
+        ):
+            await self.original_send(start_message)
+            await self.original_send(message)
+            return
+        self.compressing = True
+        body = self.compressor.compress(body, finish=not more_body)
+        headers['Content-Encoding'] = self.compressor.encoding
+        headers.add_vary_header('Accept-Encoding')
+        # Compressed body differs from original byte by byte, so strong ETag
+        # of the original can't be shared with it
+        etag = headers.get('etag')
+        if etag is not None and not etag.startswith('W/'):
+            headers['ETag'] = f'W/{etag}'
+        if more_body:
+            del headers['Content-Length']
+        else:
+            headers['Content-Length'] = str(len(body))
+        await self.original_send(start_message)
+        await self.original_send(
+            {
+                'type': 'http.response.body',
+                'body': body,
+                'more_body': more_body,
+            },
+        )
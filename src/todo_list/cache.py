@@ -0,0 +1,100 @@
+import time
+from collections import OrderedDict
+from typing import Any, Generic, Hashable, Iterator, TypeVar
+
+from prometheus_client import REGISTRY
+from prometheus_client.core import (
+    CounterMetricFamily,
+    GaugeMetricFamily,
+    Metric,
+)
+from prometheus_client.registry import Collector
+from settings import USER_CACHE_SIZE, USER_CACHE_TTL
+
+from todo_list.models import User
+
+KT = TypeVar('KT', bound=Hashable)
+VT = TypeVar('VT')
+
+
+class TTLCache(Generic[KT, VT]):
+
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[KT, tuple[float, VT]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: KT) -> VT | None:
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return None
+        expires_at, value = item
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: KT, value: VT) -> None:
+        if self.maxsize <= 0:
+            return
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate(self, key: KT) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+
+class TTLCacheCollector(Collector):
+    # Counters of caches are read on scrape, so get and put don't touch
+    # metrics
+
+    def __init__(self) -> None:
+        self.caches: dict[str, TTLCache[Any, Any]] = {}
+
+    def add(self, name: str, cache: TTLCache[Any, Any]) -> None:
+        self.caches[name] = cache
+
+    def collect(self) -> Iterator[Metric]:
+        hits = CounterMetricFamily(
+            'ttl_cache_hits',
+            'Reads of cached values',
+            labels=['cache'],
+        )
+        misses = CounterMetricFamily(
+            'ttl_cache_misses',
+            'Reads of missing or expired values',
+            labels=['cache'],
+        )
+        size = GaugeMetricFamily(
+            'ttl_cache_size',
+            'Values kept in cache',
+            labels=['cache'],
+        )
+        for name, cache in self.caches.items():
+            hits.add_metric([name], cache.hits)
+            misses.add_metric([name], cache.misses)
+            size.add_metric([name], len(cache))
+        yield from [hits, misses, size]
+
+
+ttl_cache_collector = TTLCacheCollector()
+REGISTRY.register(ttl_cache_collector)
+
+# Users authenticated by access token, keyed by username. Every write that
+# changes user must invalidate his entry.
+user_cache: TTLCache[str, User] = TTLCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+ttl_cache_collector.add('users', user_cache)
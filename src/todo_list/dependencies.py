@@ -1,15 +1,19 @@
 from uuid import UUID
 
-from bson import Binary
 from dependencies import get_db_session
-from fastapi import Depends, HTTPException
+from fastapi import Depends, HTTPException, Header
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from jose import JWTError
 from odmantic.session import AIOSession
+from pydantic import ValidationError
+from settings import JWT_STATELESS_ACCESS
 from starlette import status
 
+from todo_list.cache import user_cache
 from todo_list.enums import TokenEnum
-from todo_list.models import TODOList, User
+from todo_list.etags import parse_revision
+from todo_list.models import Principal, User
+from todo_list.queries import find_todo_list_ref
 from todo_list.utils import decode_token
 
 security = Depends(HTTPBearer())
@@ -20,10 +24,38 @@ credentials_exception = HTTPException(
 )
 
 
+async def get_user(username: str, db_session: AIOSession) -> User:
+    user = user_cache.get(username)
+    if user is None:
+        user = await db_session.find_one(User, User.username == username)
+        if user is None:
+            raise credentials_exception
+        user_cache.put(username, user)
+    return user
+
+
+def get_principal(username: str, payload: dict) -> Principal:
+    try:
+        principal = Principal(
+            id=payload['uid'],
+            username=username,
+            is_superuser=payload['su'],
+            token_version=payload['ver'],
+        )
+    except (KeyError, ValidationError):
+        raise credentials_exception
+    # Database isn't queried here, so revoked token is recognized only if
+    # user is cached (token version is bumped via save_user)
+    cached_user = user_cache.get(username)
+    if cached_user and cached_user.token_version != principal.token_version:
+        raise credentials_exception
+    return principal
+
+
 async def has_access(
         credentials: HTTPAuthorizationCredentials = security,
         db_session: AIOSession = Depends(get_db_session),
-) -> User:
+) -> User | Principal:
     token = credentials.credentials
     try:
         payload = decode_token(token, TokenEnum.ACCESS)
@@ -32,28 +64,48 @@ async def has_access(
     username = payload.get('sub')
     if username is None:
         raise credentials_exception
-    user = await db_session.find_one(User, User.username == username)
-    if user is None:
+    # Tokens issued before stateless mode was enabled have no user id
+    if JWT_STATELESS_ACCESS and 'uid' in payload:
+        return get_principal(username, payload)
+    return await get_user(username, db_session)
+
+
+async def get_current_user(
+        principal: User | Principal = Depends(has_access),
+        db_session: AIOSession = Depends(get_db_session),
+) -> User:
+    if isinstance(principal, User):
+        return principal
+    user = await get_user(principal.username, db_session)
+    if user.id != principal.id:
+        raise credentials_exception
+    if user.token_version != principal.token_version:
         raise credentials_exception
     return user
 
 
-async def get_todo_list_by_uuid(
+async def get_todo_list_ref(
         uuid: UUID,
-        user: User = Depends(has_access),
+        user: User | Principal = Depends(has_access),
         db_session: AIOSession = Depends(get_db_session),
-) -> tuple[User, TODOList, AIOSession]:
-    if user.is_superuser:
-        todo_list = await db_session.find_one(
-            TODOList,
-            TODOList.uuid == Binary.from_uuid(uuid),
-        )
-    else:
-        todo_list = await db_session.find_one(
-            TODOList,
-            TODOList.user == user.id,
-            TODOList.uuid == Binary.from_uuid(uuid),
-        )
-    if not todo_list:
+) -> dict:
+    # Only ids of list and its owner
+    todo_list = await find_todo_list_ref(db_session, user, uuid)
+    if todo_list is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
-    return user, todo_list, db_session
+    return todo_list
+
+
+async def get_if_match_revision(
+        if_match: str | None = Header(default=None),
+) -> int | None:
+    # Revision which must be current to apply write, None if any is fine
+    if if_match is None or if_match.strip() == '*':
+        return None
+    revision = parse_revision(if_match)
+    if revision is None:
+        raise HTTPException(
+            status_code=status.HTTP_412_PRECONDITION_FAILED,
+            detail='If-Match must contain single strong ETag of TODO list',
+        )
+    return revision
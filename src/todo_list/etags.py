@@ -0,0 +1,53 @@
+import hashlib
+from typing import Iterable
+
+from fastapi import Response
+from starlette import status
+
+ETAG_HEADER = 'ETag'
+
+
+def document_etag(revision: int) -> str:
+    return f'"{revision}"'
+
+
+def collection_etag(documents: Iterable[dict]) -> str:
+    # Changes whenever any document of collection is added, removed or
+    # changed, so body doesn't have to be serialized to compare it
+    digest = hashlib.blake2b(digest_size=16)
+    for document in documents:
+        revision = document.get('revision', 0)
+        digest.update(f'{document["_id"]}:{revision};'.encode())
+    return f'"{digest.hexdigest()}"'
+
+
+def parse_etags(header: str) -> list[str]:
+    return [
+        etag.strip().removeprefix('W/')
+        for etag in header.split(',')
+        if etag.strip()
+    ]
+
+
+def etag_matches(header: str | None, etag: str) -> bool:
+    if header is None:
+        return False
+    return header.strip() == '*' or etag in parse_etags(header)
+
+
+def parse_revision(header: str) -> int | None:
+    # Revision from strong ETag of document given in If-Match
+    etags = parse_etags(header)
+    if len(etags) != 1 or header.strip().startswith('W/'):
+        return None
+    try:
+        return int(etags[0].strip('"'))
+    except ValueError:
+        return None
+
+
+def not_modified(etag: str) -> Response:
+    return Response(
+        status_code=status.HTTP_304_NOT_MODIFIED,
+        headers={ETAG_HEADER: etag},
+    )
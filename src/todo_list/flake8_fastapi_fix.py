@@ -1,2 +0,0 @@
-def fix_cf009(func: None) -> bool:
-    return True
@@ -1,9 +1,14 @@
 import datetime
-from typing import Generator
+from typing import Generator, Optional
 from uuid import uuid4
 
 from bson import Binary
-from odmantic import Field, Index, Model, Reference
+from odmantic import Field, Index, Model, ObjectId, Reference, SyncEngine
+from pydantic import BaseModel
+from pymongo import ASCENDING, IndexModel
+from settings import OUTBOX_RETENTION
+
+RECIPIENTS_INDEX = 'recipients'
 
 
 class User(Model):
@@ -12,6 +17,23 @@ class User(Model):
     telegram: str
     last_seen: datetime.datetime
     is_superuser: bool = False
+    # Bumping it revokes issued stateless access tokens
+    token_version: int = 0
+
+    class Config:
+        @staticmethod
+        def indexes() -> Generator[Index, None, None]:
+            # Covers reading of notification recipients, see celery task
+            # notify_about_deleting
+            yield Index(User.id, User.telegram, name=RECIPIENTS_INDEX)
+
+
+class Principal(BaseModel):
+    # Authenticated user described by stateless access token
+    id: ObjectId  # noqa: A003, VNE003 (the same name as in User)
+    username: str
+    is_superuser: bool
+    token_version: int
 
 
 class TODOList(Model):
@@ -21,11 +43,33 @@ class TODOList(Model):
     )
     name: str
     user: User = Reference()
+    # Denormalized counters of tasks, see celery task repair_task_counters
+    task_count: int = 0
+    completed_count: int = 0
+    # Deleted lists are hidden until their tasks are removed in background.
+    # Outbox messages of deleting wait in 'outbox' field of the document
+    # until outbox relay moves them to outbox collection
+    is_deleted: bool = False
+    # Incremented by every write of the list or its tasks, used as ETag
+    revision: int = 0
 
     class Config:
         @staticmethod
-        def indexes() -> Generator[Index, None, None]:
-            yield Index(TODOList.name, TODOList.user, unique=True)
+        def indexes() -> Generator[Index | IndexModel, None, None]:
+            # Deleted lists stay until their tasks are removed, so only
+            # names of live lists are unique
+            yield IndexModel(
+                [('name', ASCENDING), ('user', ASCENDING)],
+                unique=True,
+                partialFilterExpression={'is_deleted': False},
+            )
+            # Keyset pagination of user lists
+            yield Index(TODOList.user, TODOList.id)
+            # Deleted lists whose outbox messages are not moved yet
+            yield IndexModel(
+                [('is_deleted', ASCENDING)],
+                partialFilterExpression={'outbox': {'$exists': True}},
+            )
 
 
 class Task(Model):
@@ -36,8 +80,51 @@ class Task(Model):
     name: str
     is_complete: bool
     todo_list: TODOList = Reference()
+    revision: int = 0
 
     class Config:
         @staticmethod
         def indexes() -> Generator[Index, None, None]:
             yield Index(Task.name, Task.todo_list, unique=True)
+            yield Index(Task.todo_list)
+
+
+class OutboxMessage(Model):
+    # Celery task call written together with the change that caused it and
+    # published to broker later by celery_app.outbox relay
+    task: str
+    args: list[str]
+    created_at: datetime.datetime = Field(
+        default_factory=datetime.datetime.utcnow,
+    )
+    # ODMantic fails to parse 'X | None' annotation of field with default
+    published_at: Optional[datetime.datetime] = None
+
+    class Config:
+        collection = 'outbox'
+
+        @staticmethod
+        def indexes() -> Generator[Index | IndexModel, None, None]:
+            yield Index(OutboxMessage.published_at, OutboxMessage.id)
+            # Documents without published_at are never expired by this index.
+            # Changed retention is applied by updating existing indexes
+            yield IndexModel(
+                [('published_at', ASCENDING)],
+                expireAfterSeconds=OUTBOX_RETENTION,
+            )
+
+
+def configure_models(engine: SyncEngine) -> None:
+    # Called at start of both API and Celery worker, whichever is the first
+    # Unique index of names covers only lists with is_deleted set, lists
+    # created before the field was added get it before the index is replaced
+    engine.get_collection(TODOList).update_many(
+        {'is_deleted': {'$exists': False}},
+        {'$set': {'is_deleted': False}},
+    )
+    # Replaces indexes whose options have changed, such as unique index of
+    # names which had no partial filter
+    engine.configure_database(
+        [User, TODOList, Task, OutboxMessage],
+        update_existing_indexes=True,
+    )
@@ -0,0 +1,108 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, TypeVar
+
+from fastapi import HTTPException
+from passlib.context import CryptContext
+from prometheus_client import Counter, Gauge, Histogram
+from settings import PASSWORD_MAX_PENDING, PASSWORD_WORKERS, PWD_CONTEXT
+from starlette import status
+
+T = TypeVar('T')
+
+PASSWORD_QUEUE_DEPTH = Gauge(
+    'password_queue_depth',
+    'Password operations waiting for or running in worker pool',
+)
+PASSWORD_OPERATION_SECONDS = Histogram(
+    'password_operation_seconds',
+    'Time from submitting password operation to getting its result',
+    ['operation'],
+)
+PASSWORD_REJECTED = Counter(
+    'password_rejected',
+    'Password operations rejected because worker pool is saturated',
+    ['operation'],
+)
+
+
+class PasswordService:
+
+    def __init__(
+            self,
+            context: CryptContext,
+            workers: int,
+            max_pending: int,
+    ) -> None:
+        self.context = context
+        self.max_pending = max_pending
+        self.pending = 0
+        # bcrypt releases GIL, so hashing in threads doesn't block event loop
+        # and uses several cores
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers,
+            thread_name_prefix='password',
+        )
+
+    async def hash_password(self, password: str) -> str:
+        return await self._run('hash', self.context.hash, password)
+
+    async def verify_password(
+            self,
+            password: str,
+            hashed_password: str,
+    ) -> bool:
+        return await self._run(
+            'verify',
+            self.context.verify,
+            password,
+            hashed_password,
+        )
+
+    async def _run(
+            self,
+            operation: str,
+            func: Callable[..., T],
+            *args: Any,
+    ) -> T:
+        if self.pending >= self.max_pending:
+            PASSWORD_REJECTED.labels(operation).inc()
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail='Too many authentication requests, try again later',
+                headers={'Retry-After': '1'},
+            )
+        self.pending += 1
+        PASSWORD_QUEUE_DEPTH.inc()
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self.executor, func, *args)
+        # Cancelled request doesn't stop thread, so slot is released only when
+        # operation really finishes
+        future.add_done_callback(
+            partial(self._release, operation, time.perf_counter()),
+        )
+        return await asyncio.shield(future)
+
+    def _release(
+            self,
+            operation: str,
+            started_at: float,
+            future: asyncio.Future[Any],
+    ) -> None:
+        self.pending -= 1
+        PASSWORD_QUEUE_DEPTH.dec()
+        PASSWORD_OPERATION_SECONDS.labels(operation).observe(
+            time.perf_counter() - started_at,
+        )
+        if not future.cancelled():
+            # Mark exception retrieved when nobody awaits cancelled request
+            future.exception()
+
+
+password_service = PasswordService(
+    PWD_CONTEXT,
+    PASSWORD_WORKERS,
+    PASSWORD_MAX_PENDING,
+)
@@ -0,0 +1,32 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+from celery_app.publisher import publish_tasks
+from settings import PUBLISHER_WORKERS
+
+
+class TaskPublisher:
+
+    def __init__(self, workers: int) -> None:
+        # Kombu publishes synchronously, so it's done by dedicated threads
+        # to not block event loop while broker is slow
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers,
+            thread_name_prefix='publisher',
+        )
+
+    async def publish(self, task: str, *args: Any) -> None:
+        await self.publish_many([(task, list(args))])
+
+    async def publish_many(self, messages: list[tuple[str, list]]) -> None:
+        if not messages:
+            return
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.executor, publish_tasks, messages)
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=True)
+
+
+task_publisher = TaskPublisher(PUBLISHER_WORKERS)
@@ -0,0 +1,323 @@
+from uuid import UUID, uuid4
+
+from bson import Binary
+from motor.motor_asyncio import AsyncIOMotorCursor
+from odmantic import ObjectId
+from odmantic.session import AIOSession
+from pymongo import ASCENDING, ReturnDocument
+from pymongo.errors import BulkWriteError
+
+from todo_list.models import OutboxMessage, Principal, TODOList, Task, User
+
+# Reading TODO lists through ODMantic joins owner of each list ($lookup of
+# 'user' reference) though responses need only these fields
+TODO_LIST_PROJECTION = {
+    'uuid': True,
+    'name': True,
+    'task_count': True,
+    'completed_count': True,
+    'revision': True,
+}
+TASK_PROJECTION = {
+    'uuid': True,
+    'name': True,
+    'is_complete': True,
+    'revision': True,
+}
+DUPLICATE_KEY_ERROR = 11000
+
+
+def todo_lists_filter(
+        user: User | Principal,
+        after: str | None = None,
+) -> dict:
+    conditions: dict = {'is_deleted': {'$ne': True}}
+    if not user.is_superuser:
+        conditions['user'] = user.id
+    if after is not None:
+        conditions['_id'] = {'$gt': ObjectId(after)}
+    return conditions
+
+
+def todo_list_filter(user: User | Principal, uuid: UUID) -> dict:
+    return {**todo_lists_filter(user), 'uuid': Binary.from_uuid(uuid)}
+
+
+def find_todo_lists(
+        db_session: AIOSession,
+        user: User | Principal,
+        after: str | None = None,
+        limit: int = 0,
+) -> AsyncIOMotorCursor:
+    return db_session.engine.get_collection(TODOList).find(
+        todo_lists_filter(user, after),
+        TODO_LIST_PROJECTION,
+        sort=[('_id', ASCENDING)],
+        limit=limit,
+        session=db_session.get_driver_session(),
+    )
+
+
+async def find_todo_list(
+        db_session: AIOSession,
+        user: User | Principal,
+        uuid: UUID,
+) -> dict | None:
+    return await db_session.engine.get_collection(TODOList).find_one(
+        todo_list_filter(user, uuid),
+        TODO_LIST_PROJECTION,
+        session=db_session.get_driver_session(),
+    )
+
+
+async def find_and_update_todo_list(
+        db_session: AIOSession,
+        user: User | Principal,
+        uuid: UUID,
+        fields: dict,
+        revision: int | None = None,
+) -> dict | None:
+    conditions = todo_list_filter(user, uuid)
+    if revision is not None:
+        # Optimistic concurrency, list is updated only if nobody else has
+        # changed it since given revision
+        conditions['revision'] = revision
+    return await db_session.engine.get_collection(
+        TODOList,
+    ).find_one_and_update(
+        conditions,
+        {'$set': fields, '$inc': {'revision': 1}},
+        # Owner is needed to invalidate cached responses
+        projection={**TODO_LIST_PROJECTION, 'user': True},
+        return_document=ReturnDocument.AFTER,
+        session=db_session.get_driver_session(),
+    )
+
+
+async def find_todo_list_to_delete(
+        db_session: AIOSession,
+        user: User | Principal,
+        uuid: UUID,
+) -> dict | None:
+    return await db_session.engine.get_collection(TODOList).find_one(
+        todo_list_filter(user, uuid),
+        {'name': True, 'user': True},
+        session=db_session.get_driver_session(),
+    )
+
+
+async def set_todo_list_deleted(
+        db_session: AIOSession,
+        todo_list_id: ObjectId,
+        messages: list[OutboxMessage],
+) -> bool:
+    update: dict = {'$set': {'is_deleted': True}, '$inc': {'revision': 1}}
+    if messages:
+        # Messages are kept in the list until outbox relay moves them to
+        # outbox collection, single document is updated atomically without
+        # transaction
+        update['$set']['outbox'] = [message.doc() for message in messages]
+    result = await db_session.engine.get_collection(TODOList).update_one(
+        {'_id': todo_list_id, 'is_deleted': {'$ne': True}},
+        update,
+        session=db_session.get_driver_session(),
+    )
+    return result.modified_count == 1
+
+
+async def find_todo_list_ref(
+        db_session: AIOSession,
+        user: User | Principal,
+        uuid: UUID,
+) -> dict | None:
+    return await db_session.engine.get_collection(TODOList).find_one(
+        todo_list_filter(user, uuid),
+        {'_id': True, 'user': True},
+        session=db_session.get_driver_session(),
+    )
+
+
+def tasks_filter(todo_list_id: ObjectId, uuids: list[UUID]) -> dict:
+    return {
+        'todo_list': todo_list_id,
+        'uuid': {'$in': [Binary.from_uuid(uuid) for uuid in uuids]},
+    }
+
+
+def find_tasks(
+        db_session: AIOSession,
+        todo_list_id: ObjectId,
+) -> AsyncIOMotorCursor:
+    return db_session.engine.get_collection(Task).find(
+        {'todo_list': todo_list_id},
+        TASK_PROJECTION,
+        sort=[('_id', ASCENDING)],
+        session=db_session.get_driver_session(),
+    )
+
+
+async def insert_tasks(
+        db_session: AIOSession,
+        todo_list_id: ObjectId,
+        tasks: list[dict],
+) -> list[dict]:
+    documents = [
+        {
+            'uuid': Binary.from_uuid(uuid4()),
+            'name': task['name'],
+            'is_complete': task['is_complete'],
+            'todo_list': todo_list_id,
+            'revision': 0,
+        }
+        for task in tasks
+    ]
+    errors: dict[int, str] = {}
+    try:
+        # Unordered insert doesn't stop on the first failed document
+        await db_session.engine.get_collection(Task).insert_many(
+            documents,
+            ordered=False,
+            session=db_session.get_driver_session(),
+        )
+    except BulkWriteError as exc:
+        for error in exc.details['writeErrors']:
+            if error['code'] == DUPLICATE_KEY_ERROR:
+                errors[error['index']] = 'Task with this name already exists'
+            else:
+                errors[error['index']] = error['errmsg']
+    inserted = [
+        document
+        for index, document in enumerate(documents)
+        if index not in errors
+    ]
+    await inc_task_counters(
+        db_session,
+        todo_list_id,
+        len(inserted),
+        sum(document['is_complete'] for document in inserted),
+    )
+    return [
+        {'name': document['name'], 'error': errors[index]}
+        if index in errors
+        else {'name': document['name'], 'uuid': document['uuid']}
+        for index, document in enumerate(documents)
+    ]
+
+
+async def update_tasks(
+        db_session: AIOSession,
+        todo_list_id: ObjectId,
+        uuids: list[UUID],
+        is_complete: bool,
+) -> tuple[int, int]:
+    # Revision is incremented only for tasks which state is changed, so
+    # already completed tasks aren't counted as modified
+    result = await db_session.engine.get_collection(Task).update_many(
+        tasks_filter(todo_list_id, uuids),
+        [
+            {
+                '$set': {
+                    'revision': {
+                        '$cond': [
+                            {'$eq': ['$is_complete', is_complete]},
+                            '$revision',
+                            {'$add': [{'$ifNull': ['$revision', 0]}, 1]},
+                        ],
+                    },
+                    'is_complete': is_complete,
+                },
+            },
+        ],
+        session=db_session.get_driver_session(),
+    )
+    # Only tasks which state was really changed are counted as modified
+    modified = result.modified_count
+    await inc_task_counters(
+        db_session,
+        todo_list_id,
+        0,
+        modified if is_complete else -modified,
+    )
+    return result.matched_count, modified
+
+
+async def delete_tasks(
+        db_session: AIOSession,
+        todo_list_id: ObjectId,
+        uuids: list[UUID],
+) -> int:
+    collection = db_session.engine.get_collection(Task)
+    # States of tasks are read before deleting to know how to decrement
+    # counters. Task completed between both round trips leaves counters
+    # drifted until repair_task_counters
+    tasks = await collection.find(
+        tasks_filter(todo_list_id, uuids),
+        {'is_complete': True},
+        session=db_session.get_driver_session(),
+    ).to_list(length=None)
+    if not tasks:
+        return 0
+    result = await collection.delete_many(
+        {'_id': {'$in': [task['_id'] for task in tasks]}},
+        session=db_session.get_driver_session(),
+    )
+    if result.deleted_count != len(tasks):
+        # Some of tasks were deleted by concurrent request, it's unknown
+        # which of them were completed
+        await recount_task_counters(db_session, todo_list_id)
+        return result.deleted_count
+    completed = sum(task['is_complete'] for task in tasks)
+    await inc_task_counters(
+        db_session,
+        todo_list_id,
+        -result.deleted_count,
+        -completed,
+    )
+    return result.deleted_count
+
+
+async def recount_task_counters(
+        db_session: AIOSession,
+        todo_list_id: ObjectId,
+) -> None:
+    collection = db_session.engine.get_collection(Task)
+    task_count = await collection.count_documents(
+        {'todo_list': todo_list_id},
+        session=db_session.get_driver_session(),
+    )
+    completed_count = await collection.count_documents(
+        {'todo_list': todo_list_id, 'is_complete': True},
+        session=db_session.get_driver_session(),
+    )
+    await db_session.engine.get_collection(TODOList).update_one(
+        {'_id': todo_list_id},
+        {
+            '$set': {
+                'task_count': task_count,
+                'completed_count': completed_count,
+            },
+            '$inc': {'revision': 1},
+        },
+        session=db_session.get_driver_session(),
+    )
+
+
+async def inc_task_counters(
+        db_session: AIOSession,
+        todo_list_id: ObjectId,
+        tasks: int,
+        completed: int,
+) -> None:
+    if not tasks and not completed:
+        return
+    await db_session.engine.get_collection(TODOList).update_one(
+        {'_id': todo_list_id},
+        {
+            '$inc': {
+                'task_count': tasks,
+                'completed_count': completed,
+                'revision': 1,
+            },
+        },
+        session=db_session.get_driver_session(),
+    )
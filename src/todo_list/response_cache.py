@@ -0,0 +1,182 @@
+import json
+import random
+from typing import Any, Awaitable, Callable, Protocol, TypeVar
+
+from odmantic import ObjectId
+from prometheus_client import Counter
+from redis.asyncio import Redis
+from settings import (
+    REDIS_URI,
+    RESPONSE_CACHE_BACKEND,
+    RESPONSE_CACHE_SIZE,
+    RESPONSE_CACHE_TTL,
+    RESPONSE_CACHE_VERIFY_RATE,
+)
+
+from todo_list.cache import TTLCache, ttl_cache_collector
+from todo_list.models import Principal, User
+
+T = TypeVar('T')
+
+RESPONSE_CACHE_REQUESTS = Counter(
+    'response_cache_requests',
+    'Reads of cached responses',
+    ['result'],
+)
+RESPONSE_CACHE_STALE_READS = Counter(
+    'response_cache_stale_reads',
+    'Verified cache hits which differed from database',
+)
+SUPERUSER_SCOPE = 'superuser'
+GENERATION_KEY = 'response_cache:generation:{scope}'
+VALUE_KEY = 'response_cache:{scope}:{generation}:{key}'
+
+
+class CacheBackend(Protocol):
+
+    async def get(self, key: str) -> Any | None:
+        ...
+
+    async def put(self, key: str, value: Any) -> None:
+        ...
+
+    async def generation(self, scope: str) -> int:
+        ...
+
+    async def bump(self, scopes: list[str]) -> None:
+        ...
+
+
+class LocalCacheBackend:
+    # Cache of one process, writes made through other processes are seen
+    # only after TTL
+
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        self.values: TTLCache[str, Any] = TTLCache(maxsize, ttl)
+        self.generations: dict[str, int] = {}
+
+    async def get(self, key: str) -> Any | None:
+        return self.values.get(key)
+
+    async def put(self, key: str, value: Any) -> None:
+        self.values.put(key, value)
+
+    async def generation(self, scope: str) -> int:
+        return self.generations.get(scope, 0)
+
+    async def bump(self, scopes: list[str]) -> None:
+        for scope in scopes:
+            self.generations[scope] = self.generations.get(scope, 0) + 1
+
+
+class RedisCacheBackend:
+
+    def __init__(self, redis: Redis, ttl: float) -> None:
+        self.redis = redis
+        self.ttl_ms = int(ttl * 1000)
+
+    async def get(self, key: str) -> Any | None:
+        value = await self.redis.get(key)
+        return None if value is None else json.loads(value)
+
+    async def put(self, key: str, value: Any) -> None:
+        await self.redis.set(key, json.dumps(value), px=self.ttl_ms)
+
+    async def generation(self, scope: str) -> int:
+        generation = await self.redis.get(GENERATION_KEY.format(scope=scope))
+        return int(generation or 0)
+
+    async def bump(self, scopes: list[str]) -> None:
+        async with self.redis.pipeline(transaction=False) as pipeline:
+            for scope in scopes:
+                pipeline.incr(GENERATION_KEY.format(scope=scope))
+            await pipeline.execute()
+
+
+def user_scope(user_id: ObjectId) -> str:
+    return f'user:{user_id}'
+
+
+def cache_scope(user: User | Principal) -> str:
+    # Superusers read lists of all users, so they share one scope
+    if user.is_superuser:
+        return SUPERUSER_SCOPE
+    return user_scope(user.id)
+
+
+class ResponseCache:
+    # Every key is stored under current generation of its scope. Writes
+    # bump generations of affected scopes instead of looking for keys, so
+    # all pages of scope are invalidated at once and value loaded before
+    # write can't be read after it
+
+    def __init__(self, backend: CacheBackend, verify_rate: float) -> None:
+        self.backend = backend
+        self.verify_rate = verify_rate
+
+    async def get_or_load(
+            self,
+            scope: str,
+            key: str,
+            load: Callable[[], Awaitable[T]],
+    ) -> T:
+        generation = await self.backend.generation(scope)
+        value_key = VALUE_KEY.format(
+            scope=scope,
+            generation=generation,
+            key=key,
+        )
+        value = await self.backend.get(value_key)
+        if value is None:
+            RESPONSE_CACHE_REQUESTS.labels('miss').inc()
+        else:
+            RESPONSE_CACHE_REQUESTS.labels('hit').inc()
+            if random.random() >= self.verify_rate:
+                return value
+        loaded = await load()
+        if value is not None and loaded != value:
+            RESPONSE_CACHE_STALE_READS.inc()
+        if loaded is not None:
+            await self.backend.put(value_key, loaded)
+        return loaded
+
+    async def invalidate(self, owner_id: ObjectId) -> None:
+        await self.backend.bump([user_scope(owner_id), SUPERUSER_SCOPE])
+
+
+class DisabledResponseCache(ResponseCache):
+
+    def __init__(self) -> None:
+        pass
+
+    async def get_or_load(
+            self,
+            scope: str,
+            key: str,
+            load: Callable[[], Awaitable[T]],
+    ) -> T:
+        return await load()
+
+    async def invalidate(self, owner_id: ObjectId) -> None:
+        pass
+
+
+def create_response_cache() -> ResponseCache:
+    if RESPONSE_CACHE_BACKEND == 'local':
+        backend = LocalCacheBackend(RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL)
+        ttl_cache_collector.add('responses', backend.values)
+        return ResponseCache(backend, RESPONSE_CACHE_VERIFY_RATE)
+    if RESPONSE_CACHE_BACKEND == 'redis':
+        return ResponseCache(
+            RedisCacheBackend(
+                Redis.from_url(REDIS_URI),
+                RESPONSE_CACHE_TTL,
+            ),
+            RESPONSE_CACHE_VERIFY_RATE,
+        )
+    return DisabledResponseCache()
+
+
+# Responses of TODO list reads. Every write of TODO list or its tasks must
+# invalidate cache of list owner
+response_cache = create_response_cache()
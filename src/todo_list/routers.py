@@ -1,37 +1,82 @@
 import datetime
+from functools import partial
 from uuid import UUID
 
-from celery_app.tasks import send_message_about_deleting
 from dependencies import get_db_session
-from fastapi import APIRouter, Depends, HTTPException, Header
+from fastapi import APIRouter, Depends, HTTPException, Header, Query, Response
+from fastapi.responses import StreamingResponse
 from jose import JWTError
 from odmantic.session import AIOSession
-from settings import PWD_CONTEXT
+from settings import TODO_LIST_MAX_PAGE_SIZE, TODO_LIST_PAGE_SIZE
 from starlette import status
 
 from todo_list.dependencies import (
     credentials_exception,
-    get_todo_list_by_uuid,
+    get_current_user,
+    get_if_match_revision,
+    get_todo_list_ref,
     has_access,
 )
 from todo_list.enums import TokenEnum
-from todo_list.flake8_fastapi_fix import fix_cf009
-from todo_list.models import TODOList, User
+from todo_list.etags import (
+    ETAG_HEADER,
+    collection_etag,
+    document_etag,
+    etag_matches,
+    not_modified,
+)
+from todo_list.models import Principal, TODOList, User
+from todo_list.passwords import password_service
+from todo_list.queries import (
+    delete_tasks,
+    find_and_update_todo_list,
+    find_tasks,
+    find_todo_list_ref,
+    find_todo_lists,
+    insert_tasks,
+    update_tasks,
+)
+from todo_list.response_cache import cache_scope, response_cache
 from todo_list.schemes.request import (
     RefreshTokenRequestScheme,
     TODOListRequestScheme,
+    TasksCreateRequestScheme,
+    TasksDeleteRequestScheme,
+    TasksUpdateRequestScheme,
     UserLoginRequestScheme,
     UserRegistrationRequestScheme,
 )
 from todo_list.schemes.response import (
     TODOListResponseScheme,
+    TaskCreateResultScheme,
+    TaskResponseScheme,
+    TasksDeleteResponseScheme,
+    TasksUpdateResponseScheme,
     TokensPairScheme,
     UserResponseScheme,
 )
-from todo_list.utils import create_token, decode_token
+from todo_list.serializers import (
+    json_line,
+    json_response,
+    serialize_task,
+    serialize_todo_list,
+    serialize_user,
+)
+from todo_list.utils import (
+    create_access_token,
+    create_token,
+    decode_token,
+    load_todo_list,
+    load_todo_lists_page,
+    mark_todo_list_deleted,
+    save_user,
+)
 
 router = APIRouter()
 
+NEXT_CURSOR_HEADER = 'X-Next-Cursor'
+OBJECT_ID_REGEX = '^[0-9a-f]{24}$'
+
 
 @router.post(
     '/tokens',
@@ -48,10 +93,13 @@ async def create_tokens(
     )
     if not user:
         raise HTTPException(status_code=401, detail='Bad username or password')
-    password_is_correct = PWD_CONTEXT.verify(user_data.password, user.password)
+    password_is_correct = await password_service.verify_password(
+        user_data.password,
+        user.password,
+    )
     if not password_is_correct:
         raise HTTPException(status_code=401, detail='Bad username or password')
-    access_token = create_token(user_data.username)
+    access_token = create_access_token(user)
     refresh_token = create_token(
         user_data.username,
         token_type=TokenEnum.REFRESH,
@@ -78,14 +126,17 @@ async def refresh_tokens(
     user = await db_session.find_one(User, User.username == username)
     if user is None:
         raise credentials_exception
-    access_token = create_token(user.username)
+    access_token = create_access_token(user)
     refresh_token = create_token(user.username, token_type=TokenEnum.REFRESH)
     return {'access_token': access_token, 'refresh_token': refresh_token}
 
 
 @router.get('/profile', response_model=UserResponseScheme)
-async def profile(user: User = Depends(has_access)) -> User:
-    return user
+async def profile(
+        response: Response,
+        user: User = Depends(get_current_user),
+) -> dict | Response:
+    return json_response(response, serialize_user(user.dict()))
 
 
 @router.post(
@@ -103,14 +154,14 @@ async def registration(
             status_code=status.HTTP_403_FORBIDDEN,
             detail='Registration not allowed for registered users',
         )
-    hashed_pass = PWD_CONTEXT.hash(user_creds.password)
+    hashed_pass = await password_service.hash_password(user_creds.password)
     user = User(
         username=user_creds.username,
         password=hashed_pass,
         telegram=user_creds.telegram,
         last_seen=datetime.datetime.now(),
     )
-    await db_session.save(user)
+    await save_user(db_session, user)
     return user_creds
 
 
@@ -120,79 +171,204 @@ async def registration(
     status_code=status.HTTP_201_CREATED,
 )
 async def create_todo_list(
+        response: Response,
         todo_list_data: TODOListRequestScheme,
-        user: User = Depends(has_access),
+        user: User = Depends(get_current_user),
         db_session: AIOSession = Depends(get_db_session),
 ) -> TODOList:
     todo_list = TODOList(name=todo_list_data.name, user=user)
     await db_session.save(todo_list)
+    await response_cache.invalidate(user.id)
+    response.headers[ETAG_HEADER] = document_etag(todo_list.revision)
     return todo_list
 
 
 @router.get('/todo_list', response_model=list[TODOListResponseScheme])
 async def get_todo_lists(
-        user: User = Depends(has_access),
+        response: Response,
+        limit: int = Query(
+            default=TODO_LIST_PAGE_SIZE,
+            gt=0,
+            le=TODO_LIST_MAX_PAGE_SIZE,
+        ),
+        after: str | None = Query(default=None, regex=OBJECT_ID_REGEX),
+        if_none_match: str | None = Header(default=None),
+        user: User | Principal = Depends(has_access),
         db_session: AIOSession = Depends(get_db_session),
-) -> list[TODOList]:
-    if user.is_superuser:
-        return await db_session.find(TODOList)
-    else:
-        return await db_session.find(TODOList, TODOList.user == user.id)
+) -> list[dict] | Response:
+    page = await response_cache.get_or_load(
+        cache_scope(user),
+        f'todo_lists:{after}:{limit}',
+        partial(load_todo_lists_page, db_session, user, after, limit),
+    )
+    if etag_matches(if_none_match, page['etag']):
+        return not_modified(page['etag'])
+    headers = {ETAG_HEADER: page['etag']}
+    if page['next_cursor'] is not None:
+        headers[NEXT_CURSOR_HEADER] = page['next_cursor']
+    return json_response(response, page['todo_lists'], headers)
+
+
+@router.get('/todo_list/stream', response_class=StreamingResponse)
+async def stream_todo_lists(
+        after: str | None = Query(default=None, regex=OBJECT_ID_REGEX),
+        user: User | Principal = Depends(has_access),
+        db_session: AIOSession = Depends(get_db_session),
+) -> StreamingResponse:
+    lines = (
+        json_line(serialize_todo_list(todo_list))
+        async for todo_list in find_todo_lists(db_session, user, after)
+    )
+    return StreamingResponse(lines, media_type='application/x-ndjson')
 
 
 @router.get('/todo_list/{uuid}', response_model=TODOListResponseScheme)
 async def get_todo_list(
         uuid: UUID,
-        dependencies: tuple[User, TODOList, AIOSession] = Depends(
-            get_todo_list_by_uuid,
-        ),
-) -> TODOList:
-    return dependencies[1]
+        response: Response,
+        if_none_match: str | None = Header(default=None),
+        user: User | Principal = Depends(has_access),
+        db_session: AIOSession = Depends(get_db_session),
+) -> dict | Response:
+    cached = await response_cache.get_or_load(
+        cache_scope(user),
+        f'todo_list:{uuid}',
+        partial(load_todo_list, db_session, user, uuid),
+    )
+    if cached is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    if etag_matches(if_none_match, cached['etag']):
+        return not_modified(cached['etag'])
+    return json_response(
+        response,
+        cached['todo_list'],
+        {ETAG_HEADER: cached['etag']},
+    )
 
 
 @router.put('/todo_list/{uuid}', response_model=TODOListResponseScheme)
 async def update_todo_list(
         uuid: UUID,
         todo_list_data: TODOListRequestScheme,
-        dependencies: tuple[User, TODOList, AIOSession] = Depends(
-            get_todo_list_by_uuid,
-        ),
-) -> TODOList:
-    todo_list, db_session = dependencies[1], dependencies[2]
-    # todo_list.update(todo_list_data) crush pre-commit hook flake8. It causes
-    # by flake8-fastapi plugin that cannot find 'update' function declaration.
-    # noqa doesn't help in this case, but if declare 'fix_cf009' function and
-    # save returned value to 'fixed' it works somehow, but it causes mypy check
-    # error, so this string marked as ignore for him. I hope flake8-fastapi
-    # plugin will fix soon.
-    # issue: https://github.com/Kludex/flake8-fastapi/issues/28
-    fixed = fix_cf009(todo_list.update(todo_list_data))  # type: ignore
-    if not fixed:
-        raise ValueError("'Fix for CF009 doesn't work")
-    await db_session.save(todo_list)
+        response: Response,
+        revision: int | None = Depends(get_if_match_revision),
+        user: User | Principal = Depends(has_access),
+        db_session: AIOSession = Depends(get_db_session),
+) -> dict:
+    todo_list = await find_and_update_todo_list(
+        db_session,
+        user,
+        uuid,
+        todo_list_data.dict(exclude_unset=True),
+        revision,
+    )
+    if todo_list is None and revision is not None:
+        # List exists, but has been changed since given revision
+        if await find_todo_list_ref(db_session, user, uuid) is not None:
+            raise HTTPException(
+                status_code=status.HTTP_412_PRECONDITION_FAILED,
+            )
+    if todo_list is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    await response_cache.invalidate(todo_list['user'])
+    response.headers[ETAG_HEADER] = document_etag(todo_list['revision'])
     return todo_list
 
 
 @router.delete('/todo_list/{uuid}', status_code=status.HTTP_204_NO_CONTENT)
 async def delete_todo_list(
         uuid: UUID,
-        dependencies: tuple[User, TODOList, AIOSession] = Depends(
-            get_todo_list_by_uuid,
-        ),
+        user: User | Principal = Depends(has_access),
+        db_session: AIOSession = Depends(get_db_session),
 ) -> None:
-    user, todo_list, db_session = dependencies
-    await db_session.delete(todo_list)
-    if user.is_superuser and user.id != todo_list.user:
-        telegrams = [
-            other_user.telegram
-            async for other_user in db_session.find(
-                User,
-                User.id != todo_list.user.id,
-            )
-        ]
-        for telegram in telegrams:
-            send_message_about_deleting.delay(
-                todo_list.user.username,
-                todo_list.name,
-                telegram,
-            )
+    # Tasks of large list are removed in background, then the list itself
+    todo_list = await mark_todo_list_deleted(db_session, user, uuid)
+    if todo_list is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    await response_cache.invalidate(todo_list['user'])
+
+
+@router.get(
+    '/todo_list/{uuid}/tasks',
+    response_model=list[TaskResponseScheme],
+)
+async def get_tasks(
+        uuid: UUID,
+        response: Response,
+        if_none_match: str | None = Header(default=None),
+        todo_list: dict = Depends(get_todo_list_ref),
+        db_session: AIOSession = Depends(get_db_session),
+) -> list[dict] | Response:
+    tasks = await find_tasks(
+        db_session,
+        todo_list['_id'],
+    ).to_list(length=None)
+    etag = collection_etag(tasks)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    return json_response(
+        response,
+        [serialize_task(task) for task in tasks],
+        {ETAG_HEADER: etag},
+    )
+
+
+@router.post(
+    '/todo_list/{uuid}/tasks',
+    response_model=list[TaskCreateResultScheme],
+    response_model_exclude_none=True,
+    status_code=status.HTTP_207_MULTI_STATUS,
+)
+async def create_tasks(
+        uuid: UUID,
+        tasks_data: TasksCreateRequestScheme,
+        todo_list: dict = Depends(get_todo_list_ref),
+        db_session: AIOSession = Depends(get_db_session),
+) -> list[dict]:
+    results = await insert_tasks(
+        db_session,
+        todo_list['_id'],
+        [task.dict() for task in tasks_data.tasks],
+    )
+    # Task counters of the list are changed
+    await response_cache.invalidate(todo_list['user'])
+    return results
+
+
+@router.patch(
+    '/todo_list/{uuid}/tasks',
+    response_model=TasksUpdateResponseScheme,
+)
+async def complete_tasks(
+        uuid: UUID,
+        tasks_data: TasksUpdateRequestScheme,
+        todo_list: dict = Depends(get_todo_list_ref),
+        db_session: AIOSession = Depends(get_db_session),
+) -> dict:
+    matched, modified = await update_tasks(
+        db_session,
+        todo_list['_id'],
+        tasks_data.uuids,
+        tasks_data.is_complete,
+    )
+    await response_cache.invalidate(todo_list['user'])
+    return {'matched': matched, 'modified': modified}
+
+
+@router.delete(
+    '/todo_list/{uuid}/tasks',
+    response_model=TasksDeleteResponseScheme,
+)
+async def remove_tasks(
+        uuid: UUID,
+        tasks_data: TasksDeleteRequestScheme,
+        todo_list: dict = Depends(get_todo_list_ref),
+        db_session: AIOSession = Depends(get_db_session),
+) -> dict:
+    deleted = await delete_tasks(
+        db_session,
+        todo_list['_id'],
+        tasks_data.uuids,
+    )
+    await response_cache.invalidate(todo_list['user'])
+    return {'deleted': deleted}
@@ -1,4 +1,7 @@
+from uuid import UUID
+
 from pydantic import BaseModel, Field, root_validator, validator
+from settings import TASKS_BATCH_MAX_SIZE
 
 
 class UserRegistrationRequestScheme(BaseModel):
@@ -31,3 +34,24 @@ class RefreshTokenRequestScheme(BaseModel):
 
 class TODOListRequestScheme(BaseModel):
     name: str
+
+
+class TaskRequestScheme(BaseModel):
+    name: str
+    is_complete: bool = False
+
+
+class TasksCreateRequestScheme(BaseModel):
+    tasks: list[TaskRequestScheme] = Field(
+        min_items=1,
+        max_items=TASKS_BATCH_MAX_SIZE,
+    )
+
+
+class TasksUpdateRequestScheme(BaseModel):
+    uuids: list[UUID] = Field(min_items=1, max_items=TASKS_BATCH_MAX_SIZE)
+    is_complete: bool
+
+
+class TasksDeleteRequestScheme(BaseModel):
+    uuids: list[UUID] = Field(min_items=1, max_items=TASKS_BATCH_MAX_SIZE)
@@ -16,3 +16,29 @@ class TokensPairScheme(BaseModel):
 class TODOListResponseScheme(BaseModel):
     uuid: UUID
     name: str
+    task_count: int = 0
+    completed_count: int = 0
+
+    class Config:
+        orm_mode = True
+
+
+class TaskResponseScheme(BaseModel):
+    uuid: UUID
+    name: str
+    is_complete: bool
+
+
+class TaskCreateResultScheme(BaseModel):
+    name: str
+    uuid: UUID | None = None
+    error: str | None = None
+
+
+class TasksUpdateResponseScheme(BaseModel):
+    matched: int
+    modified: int
+
+
+class TasksDeleteResponseScheme(BaseModel):
+    deleted: int
@@ -0,0 +1,68 @@
+import json
+from typing import Any, Callable
+from uuid import UUID
+
+from bson import Binary
+from fastapi import Response
+from fastapi.responses import ORJSONResponse
+from orjson import OPT_APPEND_NEWLINE, dumps
+from pydantic import BaseModel
+from settings import FAST_RESPONSES
+
+from todo_list.schemes.response import (
+    TODOListResponseScheme,
+    TaskResponseScheme,
+    UserResponseScheme,
+)
+
+
+def uuid_to_str(value: Binary | UUID) -> str:
+    if isinstance(value, Binary):
+        value = value.as_uuid()
+    return str(value)
+
+
+def build_serializer(scheme: type[BaseModel]) -> Callable[[dict], dict]:
+    # Converts raw Mongo document to JSON-compatible dict with fields of
+    # scheme without creating and validating pydantic model
+    fields = [
+        (name, field.default, uuid_to_str if field.type_ is UUID else None)
+        for name, field in scheme.__fields__.items()
+    ]
+
+    def serialize(document: dict) -> dict:
+        serialized = {}
+        for name, default, convert in fields:
+            value = document.get(name, default)
+            if convert is not None and value is not None:
+                value = convert(value)
+            serialized[name] = value
+        return serialized
+
+    return serialize
+
+
+serialize_todo_list = build_serializer(TODOListResponseScheme)
+serialize_task = build_serializer(TaskResponseScheme)
+serialize_user = build_serializer(UserResponseScheme)
+
+
+def json_response(
+        response: Response,
+        content: Any,
+        headers: dict[str, str] | None = None,
+) -> Any:
+    # Content must be already serialized by one of serializers above. In
+    # fast mode it's dumped by orjson as is, otherwise FastAPI validates it
+    # by response model of endpoint
+    if FAST_RESPONSES:
+        return ORJSONResponse(content, headers=headers)
+    if headers:
+        response.headers.update(headers)
+    return content
+
+
+def json_line(content: dict) -> bytes:
+    if FAST_RESPONSES:
+        return dumps(content, option=OPT_APPEND_NEWLINE)
+    return f'{json.dumps(content)}\n'.encode()
@@ -11,7 +11,7 @@ from odmantic.session import AIOSession
 from pytest import fixture
 
 from todo_list.enums import TokenEnum
-from todo_list.models import TODOList, User
+from todo_list.models import OutboxMessage, TODOList, Task, User
 from todo_list.tests.factories import (
     TODOListCreateFactory,
     TODOListFactory,
@@ -35,6 +35,9 @@ def event_loop() -> Generator[AbstractEventLoop, None, None]:
 @fixture(scope='session')
 async def mongo_test_engine() -> AsyncGenerator[AIOEngine, None]:
     engine = AIOEngine(client=mongo_client, database=TEST_DATABASE)
+    await engine.configure_database(
+        [User, TODOList, Task, OutboxMessage],
+    )
     yield engine
     await mongo_client.drop_database(TEST_DATABASE)
 
@@ -109,3 +112,5 @@ async def todo_lists(
         await session.save_all(todo_lists)
     yield todo_lists
     await mongo_test_engine.remove(TODOList)
+    await mongo_test_engine.remove(Task)
+    await mongo_test_engine.remove(OutboxMessage)
@@ -1,13 +1,304 @@
-from uuid import UUID
+import asyncio
+import json
+import threading
+from uuid import UUID, uuid4
 
 from bson import Binary
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Response
+from fastapi.responses import StreamingResponse
+from fastapi.security import HTTPAuthorizationCredentials
 from httpx import AsyncClient
-from odmantic import AIOEngine
+from metrics import MetricsMiddleware, UNMATCHED_ROUTE, metrics
+from middlewares import CompressionMiddleware, choose_encoding
+from odmantic import AIOEngine, ObjectId
+from prometheus_client import REGISTRY
+from pytest import raises
 from pytest_mock import MockerFixture
+from settings import PWD_CONTEXT
 
-from todo_list.models import TODOList, User
-from todo_list.tests.factories import ADMIN_PASSWORD
+from todo_list.cache import TTLCache, ttl_cache_collector, user_cache
+from todo_list.dependencies import has_access
+from todo_list.models import Principal, TODOList, User
+from todo_list.passwords import PasswordService
+from todo_list.publisher import TaskPublisher
+from todo_list.response_cache import (
+    LocalCacheBackend,
+    RESPONSE_CACHE_STALE_READS,
+    ResponseCache,
+    SUPERUSER_SCOPE,
+    user_scope,
+)
+from todo_list.schemes.response import TODOListResponseScheme
+from todo_list.serializers import serialize_todo_list
+from todo_list.tests.factories import ADMIN_PASSWORD, UserFactory
+from todo_list.utils import create_access_token
+
+
+def test_ttl_cache_evicts_least_recently_used() -> None:
+    cache: TTLCache[str, int] = TTLCache(maxsize=2, ttl=60)
+    cache.put('first', 1)
+    cache.put('second', 2)
+    assert cache.get('first') == 1
+    cache.put('third', 3)
+    assert cache.get('second') is None
+    assert cache.get('first') == 1
+    assert cache.get('third') == 3
+    assert (cache.hits, cache.misses) == (3, 1)
+
+
+def test_ttl_cache_expires(mocker: MockerFixture) -> None:
+    monotonic = mocker.patch('todo_list.cache.time.monotonic')
+    monotonic.return_value = 100
+    cache: TTLCache[str, int] = TTLCache(maxsize=2, ttl=60)
+    cache.put('first', 1)
+    monotonic.return_value = 159
+    assert cache.get('first') == 1
+    monotonic.return_value = 160
+    assert cache.get('first') is None
+    assert len(cache) == 0
+
+
+async def test_stateless_access_token(mocker: MockerFixture) -> None:
+    mocker.patch('todo_list.utils.JWT_STATELESS_ACCESS', True)
+    mocker.patch('todo_list.dependencies.JWT_STATELESS_ACCESS', True)
+    user = UserFactory()
+    credentials = HTTPAuthorizationCredentials(
+        scheme='Bearer',
+        credentials=create_access_token(user),
+    )
+    principal = await has_access(credentials, mocker.Mock())
+    assert principal == Principal(
+        id=user.id,
+        username=user.username,
+        is_superuser=user.is_superuser,
+        token_version=user.token_version,
+    )
+    revoked_user = user.copy(update={'token_version': 1})
+    mocker.patch('todo_list.dependencies.user_cache.get').return_value = (
+        revoked_user
+    )
+    with raises(HTTPException):
+        await has_access(credentials, mocker.Mock())
+
+
+async def test_password_service_rejects_when_saturated() -> None:
+    password_service = PasswordService(PWD_CONTEXT, workers=1, max_pending=1)
+    hashing = asyncio.create_task(password_service.hash_password('password'))
+    await asyncio.sleep(0)
+    with raises(HTTPException) as exc_info:
+        await password_service.hash_password('password')
+    assert exc_info.value.status_code == 503
+    hashed_password = await hashing
+    assert await password_service.verify_password('password', hashed_password)
+
+
+async def test_password_service_keeps_slot_of_cancelled_operation() -> None:
+    password_service = PasswordService(PWD_CONTEXT, workers=1, max_pending=1)
+    hashing = asyncio.create_task(password_service.hash_password('password'))
+    await asyncio.sleep(0)
+    hashing.cancel()
+    with raises(asyncio.CancelledError):
+        await hashing
+    assert password_service.pending == 1
+    with raises(HTTPException):
+        await password_service.hash_password('password')
+    while password_service.pending:
+        await asyncio.sleep(0.01)
+    assert await password_service.hash_password('password')
+
+
+async def test_response_cache_invalidated_by_owner_write() -> None:
+    owner_id, other_id = ObjectId(), ObjectId()
+    cache = ResponseCache(LocalCacheBackend(16, 60), verify_rate=0)
+    loads: list[int] = []
+
+    async def load() -> list:
+        loads.append(len(loads))
+        return [len(loads)]
+
+    assert await cache.get_or_load(user_scope(owner_id), 'key', load) == [1]
+    assert await cache.get_or_load(user_scope(owner_id), 'key', load) == [1]
+    assert await cache.get_or_load(SUPERUSER_SCOPE, 'key', load) == [2]
+    await cache.invalidate(other_id)
+    assert await cache.get_or_load(user_scope(owner_id), 'key', load) == [1]
+    await cache.invalidate(owner_id)
+    assert await cache.get_or_load(user_scope(owner_id), 'key', load) == [3]
+    assert await cache.get_or_load(SUPERUSER_SCOPE, 'key', load) == [4]
+
+
+async def test_response_cache_counts_stale_reads() -> None:
+    cache = ResponseCache(LocalCacheBackend(16, 60), verify_rate=1)
+    stale_reads = RESPONSE_CACHE_STALE_READS._value.get()
+    values = iter([['old'], ['new']])
+
+    async def load() -> list:
+        return next(values)
+
+    assert await cache.get_or_load(SUPERUSER_SCOPE, 'key', load) == ['old']
+    assert await cache.get_or_load(SUPERUSER_SCOPE, 'key', load) == ['new']
+    assert RESPONSE_CACHE_STALE_READS._value.get() == stale_reads + 1
+
+
+def test_serialize_todo_list_matches_response_scheme() -> None:
+    uuid = uuid4()
+    todo_list = {
+        '_id': ObjectId(),
+        'uuid': Binary.from_uuid(uuid),
+        'name': 'list',
+        'task_count': 2,
+        'revision': 3,
+    }
+    serialized = serialize_todo_list(todo_list)
+    assert serialized == {
+        'uuid': str(uuid),
+        'name': 'list',
+        'task_count': 2,
+        'completed_count': 0,
+    }
+    assert serialized == json.loads(
+        TODOListResponseScheme.parse_obj(todo_list).json(),
+    )
+
+
+async def test_task_publisher_publishes_in_thread(
+        mocker: MockerFixture,
+) -> None:
+    threads = []
+    publish_tasks = mocker.patch('todo_list.publisher.publish_tasks')
+    publish_tasks.side_effect = lambda messages: threads.append(
+        threading.current_thread().name,
+    )
+    task_publisher = TaskPublisher(workers=1)
+    await task_publisher.publish('task', 'first')
+    await task_publisher.publish_many([])
+    task_publisher.shutdown()
+    publish_tasks.assert_called_once_with([('task', ['first'])])
+    assert threads[0].startswith('publisher')
+
+
+def create_compressed_app() -> FastAPI:
+    compressed_app = FastAPI()
+    compressed_app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=100,
+        gzip_level=6,
+        brotli_quality=4,
+    )
+
+    @compressed_app.get('/items')
+    async def get_items(count: int, response: Response) -> list[str]:
+        response.headers['ETag'] = f'"{count}"'
+        return [f'item{number}' for number in range(count)]
+
+    @compressed_app.get('/stream')
+    async def stream_items() -> StreamingResponse:
+        lines = (f'item{number}\n' for number in range(1000))
+        return StreamingResponse(lines, media_type='text/plain')
+
+    return compressed_app
+
+
+def test_choose_encoding_by_quality() -> None:
+    assert choose_encoding('gzip;q=0.8, br;q=0.5') == 'gzip'
+    assert choose_encoding('gzip, br') == 'br'
+    assert choose_encoding('br;q=0, *') == 'gzip'
+    assert choose_encoding('br;q=0.1, *;q=0.5') == 'gzip'
+    assert choose_encoding('*;q=0') is None
+    assert choose_encoding('identity') is None
+
+
+async def test_compression_middleware_negotiates_encoding() -> None:
+    async with AsyncClient(
+            app=create_compressed_app(),
+            base_url='http://test',
+    ) as async_client:
+        small = await async_client.get('/items?count=1')
+        gzipped = await async_client.get(
+            '/items?count=1000',
+            headers={'Accept-Encoding': 'gzip, br;q=0'},
+        )
+        brotli_compressed = await async_client.get(
+            '/items?count=1000',
+            headers={'Accept-Encoding': 'gzip, br'},
+        )
+        identity = await async_client.get(
+            '/items?count=1000',
+            headers={'Accept-Encoding': 'identity'},
+        )
+        wildcard = await async_client.get(
+            '/items?count=1000',
+            headers={'Accept-Encoding': 'br;q=0, *'},
+        )
+    assert 'content-encoding' not in small.headers
+    assert gzipped.headers['content-encoding'] == 'gzip'
+    assert wildcard.headers['content-encoding'] == 'gzip'
+    assert brotli_compressed.headers['content-encoding'] == 'br'
+    assert 'content-encoding' not in identity.headers
+    assert small.headers['etag'] == '"1"'
+    assert identity.headers['etag'] == '"1000"'
+    for response in [gzipped, brotli_compressed]:
+        assert response.headers['vary'] == 'Accept-Encoding'
+        assert response.headers['etag'] == 'W/"1000"'
+        assert response.json() == identity.json()
+        assert int(response.headers['content-length']) < len(
+            identity.content,
+        )
+
+
+async def test_compression_middleware_streams_chunks() -> None:
+    async with AsyncClient(
+            app=create_compressed_app(),
+            base_url='http://test',
+            headers={'Accept-Encoding': 'gzip'},
+    ) as async_client:
+        response = await async_client.get('/stream')
+    assert response.headers['content-encoding'] == 'gzip'
+    assert 'content-length' not in response.headers
+    assert response.text.splitlines() == [
+        f'item{number}' for number in range(1000)
+    ]
+
+
+async def test_metrics_middleware_labels_requests_by_route() -> None:
+    metrics_app = FastAPI()
+    metrics_app.add_middleware(MetricsMiddleware, routes=metrics_app.routes)
+
+    @metrics_app.get('/items/{item_id}')
+    async def get_item(item_id: int) -> dict:
+        return {'id': item_id}
+
+    metrics_app.add_route('/metrics', metrics)
+
+    def requests_count(route: str, status: str) -> float:
+        labels = {'method': 'GET', 'route': route, 'status': status}
+        return REGISTRY.get_sample_value(
+            'http_request_seconds_count',
+            labels,
+        ) or 0
+
+    found = requests_count('/items/{item_id}', '200')
+    not_found = requests_count(UNMATCHED_ROUTE, '404')
+    async with AsyncClient(app=metrics_app, base_url='http://test') as client:
+        await client.get('/items/1')
+        await client.get('/items/2')
+        await client.get('/unknown')
+        response = await client.get('/metrics')
+    assert requests_count('/items/{item_id}', '200') == found + 2
+    assert requests_count(UNMATCHED_ROUTE, '404') == not_found + 1
+    assert 'http_requests_in_progress' in response.text
+
+
+def test_ttl_cache_collector_reads_counters() -> None:
+    cache: TTLCache[str, int] = TTLCache(maxsize=4, ttl=60)
+    ttl_cache_collector.add('test', cache)
+    cache.put('key', 1)
+    cache.get('key')
+    cache.get('missing')
+    cache.get('missing')
+    labels = {'cache': 'test'}
+    assert REGISTRY.get_sample_value('ttl_cache_hits_total', labels) == 1
+    assert REGISTRY.get_sample_value('ttl_cache_misses_total', labels) == 2
+    assert REGISTRY.get_sample_value('ttl_cache_size', labels) == 1
 
 
 async def test_health_check(app: FastAPI) -> None:
@@ -50,6 +341,7 @@ async def test_registration(
             User,
             User.username == response.json()['username'],
         )
+    assert user_cache.get(response.json()['username']) is not None
 
 
 async def test_get_tokens(app: FastAPI, admin: User) -> None:
@@ -84,7 +376,11 @@ async def test_create_todo_list(
     response_json = response.json()
     assert response.status_code == 201, response_json
     uuid = UUID(response_json.pop('uuid'))
-    assert response_json == todo_list_create_data
+    assert response_json == {
+        **todo_list_create_data,
+        'task_count': 0,
+        'completed_count': 0,
+    }
     async with mongo_test_engine.session() as session:
         assert await session.find_one(
             TODOList,
@@ -116,6 +412,8 @@ async def test_get_todo_lists_as_common_user(
     for todo_list in true_response:
         todo_list.pop('id')
         todo_list.pop('user')
+        todo_list.pop('is_deleted')
+        todo_list.pop('revision')
         todo_list['uuid'] = str(todo_list['uuid'].as_uuid())
     assert true_response == response_json
 
@@ -137,6 +435,8 @@ async def test_get_todo_lists_as_admin(
     for todo_list in true_response:
         todo_list.pop('id')
         todo_list.pop('user')
+        todo_list.pop('is_deleted')
+        todo_list.pop('revision')
         todo_list['uuid'] = str(todo_list['uuid'].as_uuid())
     assert true_response == response_json
 
@@ -167,6 +467,8 @@ async def test_get_todo_list_as_common_user(
     true_response = todo_list.dict()
     true_response.pop('id')
     true_response.pop('user')
+    true_response.pop('is_deleted')
+    true_response.pop('revision')
     true_response['uuid'] = str(true_response['uuid'].as_uuid())
     assert true_response == response_json
 
@@ -190,6 +492,8 @@ async def test_get_todo_list_as_admin(
     true_response = todo_list.dict()
     true_response.pop('id')
     true_response.pop('user')
+    true_response.pop('is_deleted')
+    true_response.pop('revision')
     true_response['uuid'] = str(true_response['uuid'].as_uuid())
     assert true_response == response_json
 
@@ -254,10 +558,70 @@ async def test_put_todo_list_as_common_user(
     true_response = todo_list_db.dict()
     true_response.pop('id')
     true_response.pop('user')
+    true_response.pop('is_deleted')
+    true_response.pop('revision')
     true_response['uuid'] = str(true_response['uuid'].as_uuid())
     assert true_response == response_json
 
 
+async def test_todo_list_conditional_requests(
+        app: FastAPI,
+        common_user: User,
+        access_token: str,
+        todo_lists: list[TODOList],
+        todo_list_create_data: dict,
+) -> None:
+    todo_list = None
+    for lst in todo_lists:
+        if lst.user.id == common_user.id:
+            todo_list = lst
+            break
+    assert todo_list is not None, \
+        'TODOList not created for common user (bad fixture?)'
+    url = f'/todo_list/{todo_list.uuid.as_uuid()}'
+    async with AsyncClient(
+            app=app,
+            base_url='http://test',
+            headers={'Authorization': f'Bearer {access_token}'},
+    ) as async_client:
+        response = await async_client.get(url)
+        etag = response.headers['ETag']
+        response = await async_client.get(
+            url,
+            headers={'If-None-Match': etag},
+        )
+        assert response.status_code == 304
+        assert response.content == b''
+        response = await async_client.get(
+            '/todo_list',
+            headers={'If-None-Match': etag},
+        )
+        assert response.status_code == 200
+        response = await async_client.get(
+            '/todo_list',
+            headers={'If-None-Match': response.headers['ETag']},
+        )
+        assert response.status_code == 304
+        response = await async_client.put(
+            url,
+            json=todo_list_create_data,
+            headers={'If-Match': etag},
+        )
+        assert response.status_code == 200, response.json()
+        assert response.headers['ETag'] != etag
+        response = await async_client.put(
+            url,
+            json=todo_list_create_data,
+            headers={'If-Match': etag},
+        )
+        assert response.status_code == 412
+        response = await async_client.get(
+            url,
+            headers={'If-None-Match': etag},
+        )
+    assert response.status_code == 200
+
+
 async def test_put_todo_list_as_admin(
         app: FastAPI,
         access_token_admin: str,
@@ -286,6 +650,8 @@ async def test_put_todo_list_as_admin(
     true_response = todo_list_db.dict()
     true_response.pop('id')
     true_response.pop('user')
+    true_response.pop('is_deleted')
+    true_response.pop('revision')
     true_response['uuid'] = str(true_response['uuid'].as_uuid())
     assert true_response == response_json
 
@@ -347,7 +713,54 @@ async def test_delete_todo_list_as_common_user(
             TODOList,
             TODOList.uuid == todo_list.uuid,
         )
-    assert deleted_todo_list is None
+    stored = await mongo_test_engine.get_collection(TODOList).find_one(
+        {'_id': todo_list.id},
+        {'outbox': True},
+    )
+    assert deleted_todo_list is not None
+    assert deleted_todo_list.is_deleted
+    assert [
+        (message['task'], message['args']) for message in stored['outbox']
+    ] == [
+        ('delete_todo_list_tasks', [str(todo_list.id)]),
+    ]
+
+
+async def test_recreate_deleted_todo_list(
+        app: FastAPI,
+        access_token: str,
+        todo_list_create_data: dict,
+        mongo_test_engine: AIOEngine,
+) -> None:
+    async with AsyncClient(
+            app=app,
+            base_url='http://test',
+            headers={'Authorization': f'Bearer {access_token}'},
+    ) as async_client:
+        response = await async_client.post(
+            '/todo_list',
+            json=todo_list_create_data,
+        )
+        assert response.status_code == 201, response.json()
+        deleted_uuid = response.json()['uuid']
+        response = await async_client.delete(f'/todo_list/{deleted_uuid}')
+        assert response.status_code == 204
+        response = await async_client.post(
+            '/todo_list',
+            json=todo_list_create_data,
+        )
+    assert response.status_code == 201, response.json()
+    assert response.json()['uuid'] != deleted_uuid
+    async with mongo_test_engine.session() as session:
+        todo_lists = await session.find(
+            TODOList,
+            TODOList.name == todo_list_create_data['name'],
+            sort=TODOList.id,
+        )
+    assert [todo_list.is_deleted for todo_list in todo_lists] == [
+        True,
+        False,
+    ]
 
 
 async def test_delete_todo_list_as_admin(
@@ -355,12 +768,7 @@ async def test_delete_todo_list_as_admin(
         access_token_admin: str,
         todo_lists: list[TODOList],
         mongo_test_engine: AIOEngine,
-        mocker: MockerFixture,
 ) -> None:
-    mocked_celery_task = mocker.patch(
-        'celery_app.tasks.send_message_about_deleting.delay',
-    )
-    mocked_celery_task.return_value = None
     todo_list = todo_lists[0]
     async with AsyncClient(
             app=app,
@@ -376,7 +784,17 @@ async def test_delete_todo_list_as_admin(
             TODOList,
             TODOList.uuid == todo_list.uuid,
         )
-    assert deleted_todo_list is None
+    stored = await mongo_test_engine.get_collection(TODOList).find_one(
+        {'_id': todo_list.id},
+        {'outbox': True},
+    )
+    assert deleted_todo_list is not None
+    assert deleted_todo_list.is_deleted
+    assert [
+        (message['task'], message['args']) for message in stored['outbox']
+    ] == [
+        ('delete_todo_list_tasks', [str(todo_list.id)]),
+    ]
 
 
 async def test_delete_admin_todo_list_as_common_user(
@@ -411,12 +829,7 @@ async def test_delete_todo_list_of_common_user_as_admin(
         access_token_admin: str,
         todo_lists: list[TODOList],
         mongo_test_engine: AIOEngine,
-        mocker: MockerFixture,
 ) -> None:
-    mocked_celery_task = mocker.patch(
-        'celery_app.tasks.send_message_about_deleting.delay',
-    )
-    mocked_celery_task.return_value = None
     todo_list = None
     for lst in todo_lists:
         if lst.user.id != admin.id:
@@ -438,4 +851,199 @@ async def test_delete_todo_list_of_common_user_as_admin(
             TODOList,
             TODOList.uuid == todo_list.uuid,
         )
-    assert deleted_todo_list is None
+    stored = await mongo_test_engine.get_collection(TODOList).find_one(
+        {'_id': todo_list.id},
+        {'outbox': True},
+    )
+    assert deleted_todo_list is not None
+    assert deleted_todo_list.is_deleted
+    assert [
+        (message['task'], message['args']) for message in stored['outbox']
+    ] == [
+        ('delete_todo_list_tasks', [str(todo_list.id)]),
+        ('notify_about_deleting', [str(todo_list.user.id), todo_list.name]),
+    ]
+
+
+async def test_get_todo_lists_pages_as_admin(
+        app: FastAPI,
+        access_token_admin: str,
+        todo_lists: list[TODOList],
+) -> None:
+    pages = []
+    params: dict[str, int | str] = {'limit': 4}
+    async with AsyncClient(
+            app=app,
+            base_url='http://test',
+            headers={'Authorization': f'Bearer {access_token_admin}'},
+    ) as async_client:
+        while True:
+            response = await async_client.get('/todo_list', params=params)
+            assert response.status_code == 200, response.json()
+            pages.append(response.json())
+            if 'X-Next-Cursor' not in response.headers:
+                break
+            params['after'] = response.headers['X-Next-Cursor']
+    assert [len(page) for page in pages] == [4, 4, 2]
+    true_response = [
+        {
+            'uuid': str(todo_list.uuid.as_uuid()),
+            'name': todo_list.name,
+            'task_count': 0,
+            'completed_count': 0,
+        }
+        for todo_list in todo_lists
+    ]
+    assert true_response == [item for page in pages for item in page]
+
+
+async def test_stream_todo_lists_as_common_user(
+        app: FastAPI,
+        common_user: User,
+        access_token: str,
+        todo_lists: list[TODOList],
+) -> None:
+    async with AsyncClient(
+            app=app,
+            base_url='http://test',
+            headers={'Authorization': f'Bearer {access_token}'},
+    ) as async_client:
+        response = await async_client.get('/todo_list/stream')
+    assert response.status_code == 200
+    assert response.headers['content-type'] == 'application/x-ndjson'
+    true_response = [
+        {
+            'uuid': str(todo_list.uuid.as_uuid()),
+            'name': todo_list.name,
+            'task_count': 0,
+            'completed_count': 0,
+        }
+        for todo_list in todo_lists
+        if todo_list.user.id == common_user.id
+    ]
+    assert true_response == [
+        json.loads(line) for line in response.text.splitlines()
+    ]
+
+
+async def test_tasks_bulk_operations(
+        app: FastAPI,
+        common_user: User,
+        access_token: str,
+        todo_lists: list[TODOList],
+) -> None:
+    todo_list = None
+    for lst in todo_lists:
+        if lst.user.id == common_user.id:
+            todo_list = lst
+            break
+    assert todo_list is not None, \
+        'TODOList not created for common user (bad fixture?)'
+    url = f'/todo_list/{todo_list.uuid.as_uuid()}/tasks'
+    tasks = [{'name': 'first'}, {'name': 'second'}, {'name': 'first'}]
+    async with AsyncClient(
+            app=app,
+            base_url='http://test',
+            headers={'Authorization': f'Bearer {access_token}'},
+    ) as async_client:
+        response = await async_client.post(url, json={'tasks': tasks})
+        assert response.status_code == 207, response.json()
+        created, duplicate = response.json()[:2], response.json()[2]
+        assert [task['name'] for task in created] == ['first', 'second']
+        assert duplicate == {
+            'name': 'first',
+            'error': 'Task with this name already exists',
+        }
+        response = await async_client.patch(
+            url,
+            json={
+                'uuids': [task['uuid'] for task in created],
+                'is_complete': True,
+            },
+        )
+        assert response.json() == {'matched': 2, 'modified': 2}
+        response = await async_client.request(
+            'DELETE',
+            url,
+            json={'uuids': [created[0]['uuid']]},
+        )
+        assert response.json() == {'deleted': 1}
+        response = await async_client.get(url)
+        assert response.json() == [
+            {
+                'uuid': created[1]['uuid'],
+                'name': 'second',
+                'is_complete': True,
+            },
+        ]
+        response = await async_client.get(
+            f'/todo_list/{todo_list.uuid.as_uuid()}',
+        )
+    assert response.json()['task_count'] == 1
+    assert response.json()['completed_count'] == 1
+
+
+async def test_concurrent_deleting_of_same_tasks(
+        app: FastAPI,
+        common_user: User,
+        access_token: str,
+        todo_lists: list[TODOList],
+) -> None:
+    todo_list = None
+    for lst in todo_lists:
+        if lst.user.id == common_user.id:
+            todo_list = lst
+            break
+    assert todo_list is not None, \
+        'TODOList not created for common user (bad fixture?)'
+    url = f'/todo_list/{todo_list.uuid.as_uuid()}/tasks'
+    tasks = [{'name': 'first'}, {'name': 'second'}, {'name': 'third'}]
+    async with AsyncClient(
+            app=app,
+            base_url='http://test',
+            headers={'Authorization': f'Bearer {access_token}'},
+    ) as async_client:
+        response = await async_client.post(url, json={'tasks': tasks})
+        uuids = [task['uuid'] for task in response.json()]
+        await async_client.patch(
+            url,
+            json={'uuids': uuids[:2], 'is_complete': True},
+        )
+        responses = await asyncio.gather(
+            *(
+                async_client.request('DELETE', url, json={'uuids': uuids[1:]})
+                for _ in range(2)
+            ),
+        )
+        deleted = [response.json()['deleted'] for response in responses]
+        assert sum(deleted) == 2
+        response = await async_client.get(
+            f'/todo_list/{todo_list.uuid.as_uuid()}',
+        )
+    assert response.json()['task_count'] == 1
+    assert response.json()['completed_count'] == 1
+
+
+async def test_tasks_of_admin_todo_list_as_common_user(
+        app: FastAPI,
+        common_user: User,
+        access_token: str,
+        todo_lists: list[TODOList],
+) -> None:
+    todo_list = None
+    for lst in todo_lists:
+        if lst.user.id != common_user.id:
+            todo_list = lst
+            break
+    assert todo_list is not None, \
+        'TODOList not created for admin (bad fixture?)'
+    async with AsyncClient(
+            app=app,
+            base_url='http://test',
+            headers={'Authorization': f'Bearer {access_token}'},
+    ) as async_client:
+        response = await async_client.post(
+            f'/todo_list/{todo_list.uuid.as_uuid()}/tasks',
+            json={'tasks': [{'name': 'task'}]},
+        )
+    assert response.status_code == 404, response.json()
@@ -1,20 +1,52 @@
 import datetime
+from uuid import UUID
 
 from dependencies import get_db_session
 from fastapi import Depends
 from jose import jwt
-from odmantic import query
+from odmantic import SyncEngine, query
 from odmantic.session import AIOSession
+from pymongo import MongoClient
 from pymongo.errors import ConnectionFailure
 from settings import (
     ACCESS_TOKEN_EXPIRE_MINUTES,
+    DATABASE,
     JWT_ACCESS_SECRET_KEY,
     JWT_ALGORITHM,
     JWT_REFRESH_SECRET_KEY,
+    JWT_STATELESS_ACCESS,
+    MONGO_URI,
+    TASKS_OUTBOX,
 )
+from starlette.concurrency import run_in_threadpool
 
+from todo_list.cache import user_cache
 from todo_list.enums import TokenEnum
-from todo_list.models import User
+from todo_list.etags import collection_etag, document_etag
+from todo_list.models import (
+    OutboxMessage,
+    Principal,
+    User,
+    configure_models,
+)
+from todo_list.publisher import task_publisher
+from todo_list.queries import (
+    find_todo_list,
+    find_todo_list_to_delete,
+    find_todo_lists,
+    set_todo_list_deleted,
+)
+from todo_list.serializers import serialize_todo_list
+
+
+async def configure_database() -> None:
+    # Indexes are configured by the same synchronous code as in Celery worker
+    client: MongoClient
+    with MongoClient(MONGO_URI) as client:
+        await run_in_threadpool(
+            configure_models,
+            SyncEngine(client=client, database=DATABASE),
+        )
 
 
 async def check_database(
@@ -29,10 +61,97 @@ async def check_database(
     return status
 
 
+async def save_user(db_session: AIOSession, user: User) -> User:
+    # All writes of users must go through this function to keep cache of
+    # authenticated users consistent
+    user = await db_session.save(user)
+    user_cache.put(user.username, user)
+    return user
+
+
+async def mark_todo_list_deleted(
+        db_session: AIOSession,
+        user: User | Principal,
+        uuid: UUID,
+) -> dict | None:
+    # Celery tasks are written to outbox together with the list, so request
+    # doesn't wait for broker and the tasks aren't lost when it is down
+    todo_list = await find_todo_list_to_delete(db_session, user, uuid)
+    if todo_list is None:
+        return None
+    messages = [
+        OutboxMessage(
+            task='delete_todo_list_tasks',
+            args=[str(todo_list['_id'])],
+        ),
+    ]
+    if user.is_superuser and user.id != todo_list['user']:
+        messages.append(
+            OutboxMessage(
+                task='notify_about_deleting',
+                args=[str(todo_list['user']), todo_list['name']],
+            ),
+        )
+    marked = await set_todo_list_deleted(
+        db_session,
+        todo_list['_id'],
+        messages if TASKS_OUTBOX else [],
+    )
+    if not marked:
+        # List is deleted by concurrent request
+        return None
+    if not TASKS_OUTBOX:
+        await task_publisher.publish_many(
+            [(message.task, message.args) for message in messages],
+        )
+    return todo_list
+
+
+async def load_todo_lists_page(
+        db_session: AIOSession,
+        user: User | Principal,
+        after: str | None,
+        limit: int,
+) -> dict:
+    # Page is encoded to JSON-compatible types to be stored in cache
+    todo_lists = await find_todo_lists(
+        db_session,
+        user,
+        after,
+        limit,
+    ).to_list(length=None)
+    next_cursor = None
+    if len(todo_lists) == limit:
+        next_cursor = str(todo_lists[-1]['_id'])
+    return {
+        'todo_lists': [
+            serialize_todo_list(todo_list)
+            for todo_list in todo_lists
+        ],
+        'next_cursor': next_cursor,
+        'etag': collection_etag(todo_lists),
+    }
+
+
+async def load_todo_list(
+        db_session: AIOSession,
+        user: User | Principal,
+        uuid: UUID,
+) -> dict | None:
+    todo_list = await find_todo_list(db_session, user, uuid)
+    if todo_list is None:
+        return None
+    return {
+        'todo_list': serialize_todo_list(todo_list),
+        'etag': document_etag(todo_list.get('revision', 0)),
+    }
+
+
 def create_token(
         username: str,
         expires_delta: datetime.timedelta | None = None,
         token_type: TokenEnum = TokenEnum.ACCESS,
+        extra_claims: dict | None = None,
 ) -> str:
     expire = datetime.datetime.utcnow() + (
         expires_delta or datetime.timedelta(
@@ -40,6 +159,8 @@ def create_token(
         )
     )
     claims = {'sub': username, 'exp': expire, 'type': token_type.value}
+    if extra_claims:
+        claims.update(extra_claims)
     secret_key = (
         JWT_ACCESS_SECRET_KEY
         if token_type == TokenEnum.ACCESS
@@ -53,6 +174,19 @@ def create_token(
     return encoded_jwt
 
 
+def create_access_token(user: User) -> str:
+    if not JWT_STATELESS_ACCESS:
+        return create_token(user.username)
+    return create_token(
+        user.username,
+        extra_claims={
+            'uid': str(user.id),
+            'su': user.is_superuser,
+            'ver': user.token_version,
+        },
+    )
+
+
 def decode_token(token: str, token_type: TokenEnum = TokenEnum.ACCESS) -> dict:
     secret_key = (
         JWT_ACCESS_SECRET_KEY